@@ -6,6 +6,7 @@ This module provides tools for managing the ark identifier resolver configuratio
 
 import dataclasses
 import datetime
+import importlib.util
 import json
 import logging
 import os
@@ -13,12 +14,13 @@ import sys
 import typing
 
 import click
-import httpx
-import sqlalchemy
 
-import rslv.lib_rslv.piddefine
 from arks import __version__, APP_NAME
-from arks import config as appconfig
+
+# Commands import what they need when run so that --help and light commands
+# do not pay for loading httpx, sqlalchemy, rslv and pydantic settings.
+if typing.TYPE_CHECKING:
+    from arks import config as appconfig
 
 class EnhancedJSONEncoder(json.JSONEncoder):
     """JSON encoder that handles dataclasses and datetime instances."""
@@ -45,129 +47,6 @@ def get_logger():
     return logging.getLogger(APP_NAME)
 
 
-def records_to_db(
-    records: typing.Dict[str, typing.Any],
-    db_str: str,
-    clear_existing: bool = False
-) -> typing.Tuple[int, int, int, int]:
-    """Mapping from an ARK NAAN record (naan) to a resolver PidDefinition (pd)
-
-    pd.scheme = "ark"
-    pd.prefix = naan.what
-    pd.value = None
-    pd.splitter = None
-    pd.pid_model =
-    pd.target = naan.target.url
-    pd.http_code = naan.target.http_code
-    pd.canonical = "ark:/${prefix}/${value}
-    pd.properties = naan
-    pd.synonym_for = None
-
-    Shoulder records map the same, except:
-    pd.prefix = naan.what before "/"
-    pd.value = naan.what after "/"
-    """
-
-    L = get_logger()
-    engine = sqlalchemy.create_engine(db_str, pool_pre_ping=True)
-    rslv.lib_rslv.piddefine.create_database(engine, description="ark prefixes and shoulders")
-    session = rslv.lib_rslv.piddefine.get_session(engine)
-    repository = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
-    # check to see if the list of records is more recent than the repository
-    meta = repository.get_metadata()
-    records_modified_date = datetime.datetime.fromisoformat(records["metadata"]["date_modified"])
-    _total = 0
-    _added = 0
-    _updated = 0
-    _nsynonyms = 0
-    if meta["updated"] is not None:
-        if meta["updated"] > records_modified_date:
-            L.info("Registry is concurrent with naan records")
-            return (_total, _added, _updated, _nsynonyms)
-    _synonyms = []
-    # These are all arks
-    _scheme = "ark"
-    # Template pattern for a canonical ark representation
-    # TODO: deal with the slash
-    _canonical = "ark:/${prefix}/${value}"
-
-    try:
-        # Add a base ark: scheme definition.
-        entry = rslv.lib_rslv.piddefine.PidDefinition(
-            scheme="ark",
-            target="/.info/${pid}",
-            canonical=_canonical,
-            synonym_for=None,
-            properties={
-                "what": "ark",
-                "name": "Archival Resource Key",
-            },
-        )
-        res = repository.add_or_update(entry)
-        if res["n_changes"] < 0:
-            L.info("Added entry %s", res["uniq"])
-        elif res["n_changes"] > 0:
-            L.info("Updated entry %s with %s changes", res["uniq"], res["n_changes"])
-        else:
-            L.info("Existing entry %s no changes.", res["uniq"])
-    except Exception as e:
-        L.warning(e)
-        pass
-
-    record_type_names = [
-        "PublicNAAN",
-        "PublicNAANShoulder",
-    ]
-
-    for record in records["data"]:
-        entry = None
-        if record.get("rtype") in record_type_names:
-            _prefix = record.get("what")
-            _value = None
-            if record['rtype'] == 'PublicNAANShoulder':
-                _prefix = record.get("naan", None)
-                _value = record.get("shoulder", None)
-            if _value is None and _prefix is None:
-                L.warning("Entry %s is has null prefix and value.", record["what"])
-                continue
-            _target = record.get("target", {}).get("url")
-            if _target is None:
-                _target = f"/.info/{_scheme}/{_prefix}"
-            _properties = record
-            _http_code = record.get("target", {}).get("http_code", 302)
-            _properties["target"] = {"DEFAULT": record.get("target")}
-            entry = rslv.lib_rslv.piddefine.PidDefinition(
-                scheme=_scheme,
-                prefix=_prefix,
-                value=_value,
-                target=_target,
-                http_code = _http_code,
-                canonical=_canonical,
-                synonym_for=None,
-                properties=_properties,
-            )
-        _total += 1
-        if entry is not None:
-            try:
-                res = repository.add_or_update(entry)
-                uniq = res.get("uniq", entry.uniq)
-                n_changes = res.get("n_changes", -1)
-                if n_changes < 0:
-                    _added += 1
-                    L.info("Added %s", uniq)
-                elif n_changes == 0:
-                    L.info("No changes for %s", uniq)
-                else:
-                    _updated += 1
-                    L.info("Updated %s with %s changes", uniq, n_changes)
-            except sqlalchemy.exc.IntegrityError as e:
-                repository._session.rollback()
-                L.exception(e)
-                L.error("Failed to add key for %s", entry.uniq)
-    repository.refresh_metadata()
-    return (_total, _added, _updated, _nsynonyms)
-
-
 @click.group(name="cli")
 @click.pass_context
 @click.option(
@@ -177,6 +56,8 @@ def records_to_db(
     default=None,
 )
 def cli(ctx, config) -> int:
+    from arks import config as appconfig
+
     msg = ""
     if config is not None:
         os.environ[appconfig.SETTINGS_FILE_KEY] = config
@@ -206,49 +87,81 @@ def cli(ctx, config) -> int:
 
 @cli.command("info")
 @click.pass_obj
-def get_info(config: appconfig.Settings) -> int:
+@click.option(
+    "-w",
+    "--watch",
+    type=float,
+    default=None,
+    help="Report again every WATCH seconds until interrupted."
+)
+@click.option(
+    "--json-lines",
+    is_flag=True,
+    default=False,
+    help="Print each report as a single line of JSON."
+)
+def get_info(config: "appconfig.Settings", watch: typing.Optional[float], json_lines: bool) -> int:
     """
     Print application version and basic status.
     """
+    import time
+
+    import rslv.lib_rslv.piddefine
+
+    import arks.index
+    from arks.db import get_dbsession, get_engine
+
     L = get_logger()
-    engine = sqlalchemy.create_engine(config.db_connection_string, pool_pre_ping=True)
-    session = rslv.lib_rslv.piddefine.get_session(engine)
-    repository = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
-    res = {
-        "version": __version__,
-        "environment": config.environment,
-        "status": "not initialized",
-        "description": None,
-        "created": None,
-        "updated": None,
-        "schemes": {
-            "total": 0,
-            "valid": 0
+    engine = get_engine(config.db_connection_string, readonly=True)
+
+    def _info():
+        res = {
+            "version": __version__,
+            "environment": config.environment,
+            "status": "not initialized",
+            "description": None,
+            "created": None,
+            "updated": None,
+            "schemes": {
+                "total": 0,
+                "valid": 0
+            }
         }
-    }
+        try:
+            with get_dbsession(engine) as session:
+                repository = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
+                meta = repository.get_metadata()
+                res["description"] = meta.get("description", "")
+                res["created"] = meta.get("created", "")
+                res["updated"] = meta.get("updated", "")
+                res["status"] = "initialized"
+                counts = arks.index.scheme_counts(session)
+            res["schemes"]["total"] = len(counts)
+            res["schemes"]["valid"] = sum(1 for c in counts.values() if c["valid"])
+            for s, c in counts.items():
+                res["schemes"][s] = {"prefix_count": c["prefix_count"]}
+        except Exception as e:
+            L.error(e)
+            pass
+        if res["schemes"]["total"] == 0:
+            L.warning("No schemes have been loaded!")
+        return res
+
     try:
-        meta = repository.get_metadata()
-        res["description"] = meta.get("description", "")
-        res["created"] = meta.get("created", "")
-        res["updated"] = meta.get("updated", "")
-        res["status"] = "initialized"
-        schemes = repository.list_schemes(valid_targets_only=False)
-        _schemes = schemes.all()
-        res["schemes"]["total"] = len(_schemes)
-        schemes = repository.list_schemes(valid_targets_only=True)
-        res["schemes"]["valid"] = len(schemes.all())
-        L.debug(_schemes)
-        for scheme in _schemes:
-            s = scheme[0]
-            L.debug("scheme = %s", s)
-            prefixes = repository.list_prefixes(s).all()
-            res["schemes"][s] = {"prefix_count": len(prefixes)}
-    except Exception as e:
-        L.error(e)
+        while True:
+            res = _info()
+            if json_lines:
+                res["time"] = datetime.datetime.now()
+                print(json.dumps(res, cls=EnhancedJSONEncoder), flush=True)
+            else:
+                print(json.dumps(res, indent=2, cls=EnhancedJSONEncoder), flush=True)
+            if watch is None:
+                break
+            time.sleep(watch)
+    except KeyboardInterrupt:
         pass
-    if res["schemes"]["total"] == 0:
-        L.warning("No schemes have been loaded!")
-    print(json.dumps(res, indent=2, cls=EnhancedJSONEncoder))
+    finally:
+        engine.dispose()
     return 0
 
 
@@ -260,30 +173,557 @@ def get_info(config: appconfig.Settings) -> int:
     default=None,
     help="Source JSON NAANs file or url"
 )
-def load_naans(config:appconfig.Settings, source:str) -> int:
+@click.option(
+    "-b",
+    "--bulk",
+    is_flag=True,
+    default=False,
+    help="Diff all records and write changes in a single transaction."
+)
+@click.option(
+    "-f",
+    "--force",
+    is_flag=True,
+    default=False,
+    help="Fetch the source even if unchanged since the last load."
+)
+def load_naans(config:"appconfig.Settings", source:str, bulk:bool, force:bool) -> int:
     """
     Load the identifier definitions from a NAANs json file.
 
     Default is specified in arks/config.py (overridden by settings)
+
+    The records are parsed as a stream. URL sources are requested with the
+    ETag / Last-Modified saved in the registry by the previous load and
+    skipped if not modified.
     """
+    import httpx
+
+    import arks.db
+    import arks.loader
+    import arks.naans
+
     L = get_logger()
-    L.info("Loading NAAN records from %s", source)
-    records = []
     if source is None:
         source = config.naans_source
+    L.info("Loading NAAN records from %s", source)
     if os.path.exists(source):
-        with open(source, "r") as f:
-            records = json.load(f)
+        records = arks.naans.read_naan_records(arks.naans.iter_file_chunks(source))
+        res = arks.loader.records_to_db(records, config.db_connection_string, bulk=bulk)
     else:
-        records = httpx.get(source).json()
-    res = records_to_db(records, config.db_connection_string)
-    L.info(f"Processed {res[0]} records, added {res[1]}, updated {res[2]}, synonyms {res[3]}.")
+        engine = arks.db.get_writer_engine(config.db_connection_string)
+        try:
+            with httpx.Client() as client:
+                res = arks.naans.load_source(
+                    client,
+                    source,
+                    engine,
+                    lambda records, state: arks.loader.records_to_db(
+                        records, config.db_connection_string, bulk=bulk, source_state=state
+                    ),
+                    force=force,
+                )
+        finally:
+            engine.dispose()
+        if res is None:
+            print("NAAN records not modified.")
+            return 0
+    L.info(
+        f"Processed {res[0]} records, added {res[1]}, updated {res[2]}, "
+        f"synonyms {res[3]}, removed {res[4]}."
+    )
     print("Load to db complete.")
     return 0
 
 
-try:
-    import uvicorn
+@cli.command("export-snapshot")
+@click.pass_obj
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Snapshot file to write, default is the snapshot_path setting."
+)
+def export_snapshot(config:"appconfig.Settings", output:typing.Optional[str]) -> int:
+    """
+    Write the registry to a compact snapshot file for the app to memory map.
+
+    The snapshot is written to a temporary file then renamed over the
+    output, so a running app never sees a partial snapshot.
+    """
+    import sqlalchemy
+    import rslv.lib_rslv.piddefine
+
+    import arks.index
+    import arks.snapshot
+
+    L = get_logger()
+    if output is None:
+        output = config.snapshot_path
+    if output is None:
+        raise click.ClickException("No output given and snapshot_path is not set.")
+    engine = sqlalchemy.create_engine(config.db_connection_string)
+    session = rslv.lib_rslv.piddefine.get_session(engine)
+    try:
+        repository = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
+        updated = repository.get_metadata().get("updated")
+        n = arks.snapshot.write_snapshot(
+            output,
+            arks.index.load_entries(session),
+            updated=None if updated is None else str(updated),
+        )
+    finally:
+        session.close()
+        engine.dispose()
+    L.info("Wrote %s definitions to %s", n, output)
+    print(f"Wrote {n} definitions to {output}")
+    return 0
+
+
+@cli.command("check-targets")
+@click.pass_obj
+@click.option(
+    "-o",
+    "--output",
+    type=click.File("w"),
+    default="-",
+    help="JSON lines file for the results, default stdout."
+)
+@click.option("-C", "--concurrency", default=20, help="Requests in flight.")
+@click.option("--per-host", default=2, help="Requests in flight to a single host.")
+@click.option("-t", "--timeout", default=10.0, help="Seconds to wait for connect and each read.")
+@click.option("--follow", is_flag=True, default=False, help="Follow redirects to the final URL.")
+@click.option(
+    "--probe-value",
+    default="",
+    help="Text appended to the NAAN or shoulder to form the probe identifier."
+)
+@click.option("-p", "--prefix", "prefixes", multiple=True, help="Only check these NAANs.")
+@click.option(
+    "--store/--no-store",
+    default=True,
+    help="Record results in target_checks_db and skip targets checked recently."
+)
+@click.option(
+    "--max-age",
+    type=float,
+    default=None,
+    help="Hours within which a stored check is fresh, default target_check_max_age. 0 checks all."
+)
+@click.option(
+    "--changed",
+    is_flag=True,
+    default=False,
+    help="Only check targets whose definition changed since their last check."
+)
+@click.option(
+    "--max-host-failures",
+    default=3,
+    help="Skip the rest of a host's targets after this many failures in a run."
+)
+def check_targets(
+    config:"appconfig.Settings",
+    output:typing.TextIO,
+    concurrency:int,
+    per_host:int,
+    timeout:float,
+    follow:bool,
+    probe_value:str,
+    prefixes:typing.Tuple[str, ...],
+    store:bool,
+    max_age:typing.Optional[float],
+    changed:bool,
+    max_host_failures:int
+) -> int:
+    """
+    Check the target URLs of NAAN and shoulder definitions.
+
+    Each target template is expanded for a probe identifier and requested,
+    without reading the response body. One JSON result per target is
+    written as each check completes.
+
+    Results are stored as they complete, so an interrupted run resumes by
+    running again. Targets checked within --max-age hours are skipped, and
+    hosts that failed every check of previous runs are backed off.
+    """
+    import asyncio
+    import datetime
+
+    import arks.checker
+    import arks.checkstore
+    import arks.index
+    from arks.db import get_dbsession, get_engine
+
+    L = get_logger()
+    engine = get_engine(config.db_connection_string, readonly=True)
+    with get_dbsession(engine) as dbsession:
+        entries = [
+            entry for entry in arks.index.load_entries(dbsession)
+            if not prefixes or entry.prefix in prefixes
+        ]
+        record_updates = arks.checkstore.load_record_updates(dbsession) if changed else None
+    engine.dispose()
+    targets = list(arks.checker.iter_targets(entries, probe_value=probe_value))
+    L.info("%s targets", len(targets))
+
+    def _write(result):
+        output.write(json.dumps(result) + "\n")
+        output.flush()
+
+    check_args = {
+        "concurrency": concurrency,
+        "per_host": per_host,
+        "timeout": timeout,
+        "follow_all": follow,
+        "headers": {"User-Agent": f"{APP_NAME}/{__version__} target-check"},
+    }
+    if not store:
+        if changed:
+            raise click.ClickException("--changed needs the result store.")
+        counts = asyncio.run(arks.checker.check_targets(targets, _write, **check_args))
+        L.info("Checked %s targets: %s", len(targets), counts)
+        return 0
+    if max_age is None:
+        max_age = config.target_check_max_age
+    store_url = config.target_checks_db
+    if store_url is None:
+        try:
+            store_url = arks.checkstore.default_store_url(config.db_connection_string)
+        except ValueError as e:
+            raise click.ClickException(str(e))
+    check_store = arks.checkstore.CheckStore(store_url)
+    try:
+        summary = asyncio.run(arks.checkstore.run_checks(
+            check_store,
+            targets,
+            _write,
+            max_age=datetime.timedelta(hours=max_age) if max_age > 0 else None,
+            record_updates=record_updates,
+            max_host_failures=max_host_failures,
+            **check_args,
+        ))
+    finally:
+        check_store.close()
+    L.info("Checked targets: %s, skipped: %s", summary["status"], summary["skipped"])
+    return 0
+
+
+@cli.command("bench")
+@click.pass_obj
+@click.option(
+    "-s",
+    "--source",
+    default=None,
+    help="NAAN records fixture file or url, default is the configured naans_source."
+)
+@click.option("-n", "--requests", "n_requests", default=5000, help="Number of timed requests.")
+@click.option("-w", "--warmup", default=200, help="Number of untimed requests sent first.")
+@click.option("-C", "--concurrency", default=10, help="Requests in flight.")
+@click.option(
+    "--index/--no-index",
+    "use_index",
+    default=None,
+    help="Override the resolver_index setting."
+)
+@click.option(
+    "--service-url",
+    default="https://n2t.net/",
+    help="Service URL prepended for service_pattern requests."
+)
+@click.option("--seed", default=0, help="Random seed for the workload.")
+@click.option("--json", "as_json", is_flag=True, default=False, help="Print the report as JSON.")
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Also write the JSON report to this file."
+)
+def bench(
+    config:"appconfig.Settings",
+    source:str,
+    n_requests:int,
+    warmup:int,
+    concurrency:int,
+    use_index:typing.Optional[bool],
+    service_url:str,
+    seed:int,
+    as_json:bool,
+    output:typing.Optional[str]
+) -> int:
+    """
+    Measure resolver throughput and latency in-process.
+
+    The NAAN records are loaded into a temporary registry and a mix of
+    NAAN, shoulder, miss, introspection and service URL prefixed requests
+    is sent to arks.app:app through the ASGI transport.
+    """
+    import asyncio
+    import tempfile
+
+    import httpx
+
+    import arks.app
+    import arks.bench
+    import arks.loader
+    import arks.naans
+
+    L = get_logger()
+    if source is None:
+        source = config.naans_source
+    if os.path.exists(source):
+        records = arks.naans.read_naan_records(arks.naans.iter_file_chunks(source))
+        records["data"] = list(records["data"])
+    else:
+        with httpx.stream("GET", source) as response:
+            response.raise_for_status()
+            records = arks.naans.read_naan_records(response.iter_text())
+            records["data"] = list(records["data"])
+    _service_url = arks.bench.service_url_for(config.service_pattern, service_url)
+    workload = arks.bench.build_workload(
+        records["data"], warmup + n_requests, service_url=_service_url, seed=seed
+    )
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_str = f"sqlite:///{tmp_dir}/registry.sqlite"
+        res = arks.loader.records_to_db(records, db_str, bulk=True)
+        L.info("Loaded %s records into %s", res[0], db_str)
+        update = {"db_connection_string": db_str, "registry_poll_interval": 0}
+        if use_index is not None:
+            update["resolver_index"] = use_index
+        settings = config.model_copy(update=update)
+        arks.app.app.state.settings = settings
+
+        async def _run():
+            async with arks.bench.app_client(arks.app.app) as client:
+                await arks.bench.run_workload(client, workload[:warmup], concurrency)
+                return await arks.bench.run_workload(client, workload[warmup:], concurrency)
+
+        report = asyncio.run(_run())
+    report["config"] = {
+        "version": __version__,
+        "source": source,
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "resolver_index": settings.resolver_index,
+        "db_async": settings.db_async,
+        "service_pattern": settings.service_pattern,
+    }
+    report_json = json.dumps(report, indent=2)
+    if output is not None:
+        with open(output, "w") as f:
+            f.write(report_json)
+    if as_json:
+        print(report_json)
+        return 0
+    overall = report["overall"]
+    print(f"{overall['requests_per_sec']} requests/sec over {overall['count']} requests")
+    print(f"{'kind':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, summary in list(report["kinds"].items()) + [("overall", overall)]:
+        print(
+            f"{kind:<16}{summary['count']:>8}{summary['p50_ms']:>10.3f}"
+            f"{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}"
+        )
+    print(f"status: {report['status']}")
+    return 0
+
+
+@cli.command("replay")
+@click.pass_obj
+@click.argument("logfile", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--url",
+    default=None,
+    help="Base URL to send requests to, default is arks.app:app in-process."
+)
+@click.option(
+    "--speed",
+    default=1.0,
+    help="Multiple of the logged request rate, 0 for as fast as possible."
+)
+@click.option("-C", "--concurrency", default=50, help="Maximum requests in flight.")
+@click.option("-n", "--limit", type=int, default=None, help="Replay at most this many requests.")
+@click.option(
+    "--route",
+    "routes",
+    multiple=True,
+    help="Regular expression of resolver routed paths, default is the Unit configuration routes."
+)
+@click.option("--json", "as_json", is_flag=True, default=False, help="Print the report as JSON.")
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    default=None,
+    help="Also write the JSON report to this file."
+)
+def replay(
+    config:"appconfig.Settings",
+    logfile:str,
+    url:typing.Optional[str],
+    speed:float,
+    concurrency:int,
+    limit:typing.Optional[int],
+    routes:typing.Tuple[str, ...],
+    as_json:bool,
+    output:typing.Optional[str]
+) -> int:
+    """
+    Replay resolver requests from a Unit access log, optionally gzip compressed.
+
+    Responses are compared with the logged status. The log does not record
+    the Location header, so redirect targets are not compared.
+    """
+    import asyncio
+    import itertools
+
+    import httpx
+
+    import arks.replay
+
+    records = arks.replay.resolver_records(
+        arks.replay.parse_log(arks.replay.open_log(logfile)),
+        routes=routes or arks.replay.RESOLVER_ROUTES,
+    )
+    if limit is not None:
+        records = itertools.islice(records, limit)
+
+    async def _run():
+        if url is not None:
+            async with httpx.AsyncClient(
+                base_url=url, limits=httpx.Limits(max_connections=concurrency)
+            ) as client:
+                return await arks.replay.replay(client, records, speed=speed, concurrency=concurrency)
+        import arks.app
+        import arks.bench
+
+        async with arks.bench.app_client(arks.app.app) as client:
+            return await arks.replay.replay(client, records, speed=speed, concurrency=concurrency)
+
+    report = asyncio.run(_run())
+    report["config"] = {
+        "version": __version__,
+        "logfile": logfile,
+        "url": url,
+        "speed": speed,
+        "concurrency": concurrency,
+    }
+    report_json = json.dumps(report, indent=2)
+    if output is not None:
+        with open(output, "w") as f:
+            f.write(report_json)
+    if as_json:
+        print(report_json)
+        return 0
+    overall = report["overall"]
+    print(
+        f"{overall.get('requests_per_sec', 0)} requests/sec over {overall['count']} requests, "
+        f"max lag {report['max_lag_ms']} ms"
+    )
+    print(f"{'kind':<16}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for kind, summary in list(report["kinds"].items()) + [("overall", overall)]:
+        print(
+            f"{kind:<16}{summary['count']:>8}{summary['p50_ms']:>10.3f}"
+            f"{summary['p95_ms']:>10.3f}{summary['p99_ms']:>10.3f}"
+        )
+    print(f"status: {report['status']}")
+    print(f"status match: {100.0 * report['status_match']:.2f}%, mismatches: {report['mismatches']}")
+    return 0
+
+
+@cli.group("traces")
+def traces() -> None:
+    """Inspect request traces captured with profile_enabled."""
+
+
+@traces.command("list")
+@click.pass_obj
+def traces_list(config:"appconfig.Settings") -> int:
+    """List captured traces, oldest first."""
+    import arks.profiling
+
+    ring = arks.profiling.TraceRing(config.profile_dir, config.profile_ring_size)
+    for trace in ring.list():
+        print(
+            f"{trace['id']}  {trace['status']}  {trace['elapsed_ms']:>10.3f} ms  "
+            f"{len(trace['statements']):>3} sql  {'P' if trace['profiled'] else ' '}  "
+            f"{trace['method']} {trace['path']}"
+        )
+    return 0
+
+
+@traces.command("dump")
+@click.pass_obj
+@click.argument("trace_id")
+@click.option("--sort", default="cumulative", help="pstats sort key for the profile.")
+@click.option("-l", "--limit", default=30, help="Number of profile rows to print.")
+def traces_dump(config:"appconfig.Settings", trace_id:str, sort:str, limit:int) -> int:
+    """Print a trace with its SQL statements and profile."""
+    import arks.profiling
+
+    ring = arks.profiling.TraceRing(config.profile_dir, config.profile_ring_size)
+    try:
+        trace = ring.read(trace_id)
+    except FileNotFoundError:
+        raise click.ClickException(f"No trace {trace_id} in {config.profile_dir}")
+    statements = trace.pop("statements")
+    print(json.dumps(trace, indent=2))
+    for statement in statements:
+        print(f"-- {statement.get('ms', '?')} ms")
+        print(statement["statement"])
+    report = ring.profile_report(trace_id, sort=sort, limit=limit)
+    if report is not None:
+        print(
+            f"Profile of the event loop thread while the request ran, including "
+            f"{trace.get('overlapping', 0)} overlapping requests and excluding "
+            f"sync handlers run in the threadpool."
+        )
+        print(report)
+    return 0
+
+
+@cli.command("importtime")
+@click.option("-m", "--module", default="arks.app", help="Module to import.")
+@click.option("-n", "--top", default=20, help="Number of modules to list.")
+@click.option(
+    "--sort",
+    type=click.Choice(["cumulative", "self"]),
+    default="cumulative",
+    help="Order modules by cumulative or self import time."
+)
+def importtime(module:str, top:int, sort:str) -> int:
+    """
+    Report the import time of a module in a fresh interpreter.
+
+    This is the cold start cost paid by each new worker process before it
+    can serve a request, e.g. for "arks.app", or by a CLI command.
+    """
+    import subprocess
+    import time
+
+    import arks.importtime
+
+    t0 = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise click.ClickException(f"Import of {module} failed:\n{proc.stderr[-2000:]}")
+    entries = arks.importtime.parse_importtime(proc.stderr)
+    total_us = sum(e.cumulative_us for e in entries if e.depth == 0)
+    key = (lambda e: e.cumulative_us) if sort == "cumulative" else (lambda e: e.self_us)
+    print(f"{module}: {len(entries)} modules imported in {total_us / 1000.0:.1f} ms")
+    print(f"Interpreter start to exit: {elapsed * 1000.0:.1f} ms")
+    print(f"{'self ms':>10}{'cumul ms':>10}  module")
+    for e in sorted(entries, key=key, reverse=True)[:top]:
+        print(f"{e.self_us / 1000.0:>10.1f}{e.cumulative_us / 1000.0:>10.1f}  {'  ' * e.depth}{e.module}")
+    return 0
+
+
+if importlib.util.find_spec("uvicorn") is not None:
 
     @cli.command("serve")
     @click.pass_obj
@@ -294,8 +734,10 @@ try:
         default=False,
         help="Enable service reload on source change.",
     )
-    def dev_server(config:appconfig.Settings, reload:bool) -> int:
+    def dev_server(config:"appconfig.Settings", reload:bool) -> int:
         """Run a local development server."""
+        import uvicorn
+
         uvicorn.run(
             "arks.app:app",
             host=config.devhost,
@@ -305,7 +747,33 @@ try:
         )
         return 0
 
-except ImportError:
+    @cli.command("serve-prefork")
+    @click.pass_obj
+    @click.option("-w", "--workers", type=int, default=None, help="Number of worker processes.")
+    @click.option("--host", default=None, help="Address to listen on.")
+    @click.option("--port", type=int, default=None, help="Port to listen on.")
+    def prefork_server(
+        config:"appconfig.Settings",
+        workers:typing.Optional[int],
+        host:typing.Optional[str],
+        port:typing.Optional[int]
+    ) -> int:
+        """
+        Run the production server with pre-forked workers.
+
+        The registry snapshot is loaded once before the workers are forked and
+        shared with them. Defaults are the serve_host, serve_port and
+        serve_workers settings.
+        """
+        import arks.prefork
+
+        return arks.prefork.serve(
+            host if host is not None else config.serve_host,
+            port if port is not None else config.serve_port,
+            workers if workers is not None else config.serve_workers,
+        )
+
+else:
     print("Install uvicorn for development serve option to be available.")
 
 
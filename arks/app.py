@@ -1,18 +1,41 @@
+import asyncio
 import contextlib
 import functools
+import json
 import logging
+import math
+import random
+import time
 import typing
 
 import fastapi
 import fastapi.middleware.cors
+import fastapi.responses
 import fastapi.staticfiles
-import fastapi.templating
-import sqlalchemy.orm
+import rslv.lib_rslv.piddefine
 import rslv.routers.resolver
 
+import arks.cache
+import arks.index
+import arks.introspection
+import arks.metrics
+import arks.notfound
+import arks.pages
+import arks.ratelimit
+import arks.resolve
+import arks.snapshot
 from arks.config import get_settings
+from arks.db import (
+    get_async_engine,
+    get_dbsession,
+    get_engine,
+    get_lazy_dbsession,
+)
 from arks import __version__, APP_NAME
 
+# NDJSON lines per chunk of a batch resolve response
+BATCH_CHUNK_LINES = 500
+
 
 def get_logger():
     return logging.getLogger(APP_NAME)
@@ -30,40 +53,205 @@ def setup_logger(app: fastapi.FastAPI) -> None:
     logging.basicConfig(level=_levels[level_str])
 
 
-@functools.lru_cache(maxsize=None)
-def get_engine(dbcnstr: str) -> sqlalchemy.engine.base.Engine:
-    engine =  sqlalchemy.create_engine(dbcnstr, pool_pre_ping=True)
-    return engine
-
-
-@contextlib.contextmanager
-def get_dbsession(dbengine) -> typing.Iterator[sqlalchemy.orm.Session]:
-    dbsession = sqlalchemy.orm.sessionmaker(bind=dbengine)()
-    try:
-        yield dbsession
-    except Exception:
-        dbsession.rollback()
-        raise
-    finally:
-        dbsession.close()
-
-
 async def app_report_startup(app: fastapi.FastAPI) -> None:
     L = get_logger()
     L.info("Application settings")
     L.info("environment = %s", app.state.settings.environment )
     L.info("db_connection_string = %s", app.state.settings.db_connection_string)
     L.info("allow_appinfo = %s", app.state.settings.allow_appinfo)
+    L.info("allow_metrics = %s", app.state.settings.allow_metrics)
+    L.info("profile_enabled = %s", app.state.settings.profile_enabled)
     L.info("service_pattern = %s", app.state.settings.service_pattern)
     L.info("auto_introspection = %s", app.state.settings.auto_introspection)
+    L.info("db_async = %s", app.state.settings.db_async)
+    L.info("db_readonly = %s", app.state.settings.db_readonly)
+    L.info("resolver_index = %s", app.state.settings.resolver_index)
+    L.info("snapshot_path = %s", app.state.settings.snapshot_path)
+    L.info("info_cache_size = %s", app.state.settings.info_cache_size)
+    L.info("info_prewarm = %s", app.state.settings.info_prewarm)
+    L.info("reject_unknown_naans = %s", app.state.settings.reject_unknown_naans)
+    L.info("rate_limit_rate = %s", app.state.settings.rate_limit_rate)
+    L.info("max_inflight = %s", app.state.settings.max_inflight)
+    L.info("registry_poll_interval = %s", app.state.settings.registry_poll_interval)
+
+
+def engine_options(settings) -> typing.Dict[str, typing.Any]:
+    """get_engine options of the app's registry readers."""
+    return {
+        "readonly": settings.db_readonly,
+        "mmap_size": settings.sqlite_mmap_size,
+        "cache_size": settings.sqlite_cache_size,
+    }
+
+
+def load_resolver_index(dbengine) -> typing.Optional[arks.index.PrefixIndex]:
+    L = get_logger()
+    try:
+        with get_dbsession(dbengine) as dbsession:
+            index = arks.index.build_index(dbsession)
+    except Exception as e:
+        L.error("Unable to load resolver index: %s", e)
+        return None
+    L.info("Resolver index loaded with %s definitions", len(index))
+    return index
+
+
+def load_index_entries(dbengine) -> typing.List[arks.index.IndexEntry]:
+    with get_dbsession(dbengine) as dbsession:
+        return list(arks.index.load_entries(dbsession))
+
+
+def load_known_prefixes(index, dbengine) -> typing.Optional[arks.index.PrefixSet]:
+    """Registered NAANs from the resolver index if any, else from the database."""
+    L = get_logger()
+    try:
+        if index is not None:
+            known = arks.index.PrefixSet((e.scheme, e.prefix) for e in index)
+        else:
+            with get_dbsession(dbengine) as dbsession:
+                known = arks.index.load_prefix_set(dbsession)
+    except Exception as e:
+        L.error("Unable to load registered NAANs: %s", e)
+        return None
+    L.info("Known NAAN set loaded with %s prefixes", len(known))
+    return known
+
+
+def load_snapshot(path: str) -> typing.Optional[arks.snapshot.SnapshotIndex]:
+    L = get_logger()
+    try:
+        index = arks.snapshot.SnapshotIndex(path)
+    except (OSError, ValueError) as e:
+        L.error("Unable to load registry snapshot: %s", e)
+        return None
+    L.info("Registry snapshot %s mapped with %s definitions", path, len(index))
+    return index
+
+
+def get_registry_updated(dbengine) -> typing.Any:
+    """Return the registry "updated" metadata value, a single row read."""
+    with get_dbsession(dbengine) as dbsession:
+        repository = rslv.lib_rslv.piddefine.PidDefinitionCatalog(dbsession)
+        return repository.get_metadata().get("updated")
+
+
+async def watch_registry(app: fastapi.FastAPI) -> None:
+    """Poll the registry metadata and rebuild the resolver index when it changes.
+
+    The index is built in a worker thread and swapped in with a single
+    attribute assignment, so requests see either the old or the new index.
+    """
+    L = get_logger()
+    interval = app.state.settings.registry_poll_interval
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            updated = await asyncio.to_thread(get_registry_updated, app.state.dbengine)
+            if updated == app.state.registry_updated:
+                continue
+            L.info("Registry updated at %s", updated)
+            if app.state.settings.resolver_index:
+                index = await asyncio.to_thread(load_resolver_index, app.state.dbengine)
+                if index is None:
+                    continue
+                app.state.resolver_index = index
+            if app.state.settings.reject_unknown_naans:
+                known = await asyncio.to_thread(
+                    load_known_prefixes, app.state.resolver_index, app.state.dbengine
+                )
+                if known is None:
+                    continue
+                app.state.known_prefixes = known
+            app.state.registry_updated = updated
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            L.error("Registry poll failed: %s", e)
+
+
+async def watch_snapshot(app: fastapi.FastAPI) -> None:
+    """Poll the snapshot file and map the new file when it is replaced."""
+    L = get_logger()
+    path = app.state.settings.snapshot_path
+    interval = app.state.settings.registry_poll_interval
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            current = app.state.resolver_index
+            if current is not None and arks.snapshot.file_id(path) == current.file_id:
+                continue
+            index = await asyncio.to_thread(load_snapshot, path)
+            if index is None:
+                continue
+            if app.state.settings.reject_unknown_naans:
+                known = await asyncio.to_thread(load_known_prefixes, index, app.state.dbengine)
+                if known is None:
+                    # Keep the previous snapshot and NAANs, retried next poll
+                    index.close()
+                    continue
+                app.state.known_prefixes = known
+            # The old mapping is released once requests using it complete
+            app.state.resolver_index = index
+            app.state.registry_updated = index.updated
+        except asyncio.CancelledError:
+            raise
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            L.error("Snapshot poll failed: %s", e)
 
 
 @contextlib.asynccontextmanager
 async def dbengine_lifespan(app: fastapi):
+    L = get_logger()
     await app_report_startup(app)
     dbcnstr = app.state.settings.db_connection_string
-    app.state.dbengine = get_engine(dbcnstr)
+    app.state.dbengine = get_engine(dbcnstr, **engine_options(app.state.settings))
+    if app.state.settings.db_async:
+        app.state.async_dbengine = get_async_engine(dbcnstr, **engine_options(app.state.settings))
+    if app.state.settings.allow_metrics:
+        arks.metrics.instrument_engine(app.state.dbengine)
+        if app.state.async_dbengine is not None:
+            arks.metrics.instrument_engine(app.state.async_dbengine.sync_engine)
+    if app.state.settings.profile_enabled:
+        arks.profiling.capture_statements(app.state.dbengine)
+        if app.state.async_dbengine is not None:
+            arks.profiling.capture_statements(app.state.async_dbengine.sync_engine)
+    if app.state.settings.snapshot_path:
+        app.state.resolver_index = load_snapshot(app.state.settings.snapshot_path)
+        if app.state.resolver_index is not None:
+            app.state.registry_updated = app.state.resolver_index.updated
+    elif app.state.preloaded_index is not None:
+        # Built once by the prefork parent and shared with this worker
+        app.state.resolver_index = app.state.preloaded_index
+    else:
+        try:
+            app.state.registry_updated = get_registry_updated(app.state.dbengine)
+        except Exception as e:
+            L.error("Unable to read registry metadata: %s", e)
+        if app.state.settings.resolver_index:
+            app.state.resolver_index = load_resolver_index(app.state.dbengine)
+    if app.state.settings.reject_unknown_naans:
+        app.state.known_prefixes = load_known_prefixes(
+            app.state.resolver_index, app.state.dbengine
+        )
+    watcher = None
+    if app.state.settings.registry_poll_interval > 0:
+        if app.state.settings.snapshot_path:
+            watcher = asyncio.create_task(watch_snapshot(app))
+        else:
+            watcher = asyncio.create_task(watch_registry(app))
+    prewarm = None
+    if app.state.settings.info_prewarm and app.state.settings.info_cache_size > 0:
+        prewarm = asyncio.create_task(prewarm_info(app))
     yield
+    for task in (watcher, prewarm):
+        if task is not None:
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+    if app.state.async_dbengine is not None:
+        await app.state.async_dbengine.dispose()
     if app.state.dbengine is not None:
         app.state.dbengine.dispose()
 
@@ -83,16 +271,45 @@ app = fastapi.FastAPI(
 )
 
 app.state.settings = get_settings()
+# Compiled once, shared by the early resolve paths
+app.state.identifier_splitter = arks.resolve.IdentifierSplitter(
+    app.state.settings.service_pattern,
+    cache_size=app.state.settings.pid_cache_size,
+)
+app.state.resolve_cache = arks.cache.TTLCache(
+    app.state.settings.resolve_cache_size,
+    app.state.settings.resolve_cache_ttl,
+)
+app.state.info_cache = arks.cache.TTLCache(
+    app.state.settings.info_cache_size,
+    app.state.settings.info_cache_ttl,
+)
+app.state.negative_cache = arks.cache.TTLCache(
+    app.state.settings.negative_cache_size,
+    app.state.settings.negative_cache_ttl,
+)
+# Registered NAANs when reject_unknown_naans is set
+app.state.known_prefixes = None
+app.state.unknown_naan_rejects = 0
+app.state.rate_limiter = None
+if app.state.settings.rate_limit_rate > 0:
+    app.state.rate_limiter = arks.ratelimit.TokenBucketLimiter(
+        app.state.settings.rate_limit_rate,
+        app.state.settings.rate_limit_burst,
+        app.state.settings.rate_limit_clients,
+    )
+app.state.rate_limit_exempt = frozenset(app.state.settings.rate_limit_exempt)
+app.state.inflight = 0
+app.state.rate_limited = 0
+app.state.shed = 0
+app.state.async_dbengine = None
+app.state.resolver_index = None
+app.state.registry_updated = None
+# Resolver index built before forking workers, see arks.prefork
+app.state.preloaded_index = None
+app.state.pages = None
 setup_logger(app)
 
-# Enables CORS for UIs on different domains
-app.add_middleware(
-    fastapi.middleware.cors.CORSMiddleware,
-    allow_origins=["*", ],
-    allow_credentials=True,
-    allow_methods=["*", ],
-    allow_headers=["*", ],
-)
 
 def get_relative_url_for(name: str, *args: typing.Any, **kwargs: typing.Any) -> str:
     _path = kwargs.get("path", "/")
@@ -101,12 +318,154 @@ def get_relative_url_for(name: str, *args: typing.Any, **kwargs: typing.Any) ->
 
 @app.middleware("http")
 async def add_db_session_middleware(request: fastapi.Request, call_next):
-    with get_dbsession(request.app.state.dbengine) as dbsession:
+    # The session is only opened if a handler uses it.
+    t0 = time.perf_counter()
+    with get_lazy_dbsession(request.app.state.dbengine) as dbsession:
         request.state.dbsession = dbsession
         response = await call_next(request)
+    arks.metrics.SESSION_MIDDLEWARE.observe(time.perf_counter() - t0)
+    return response
+
+
+# Plain ASGI middleware, so requests pass through without a BaseHTTPMiddleware
+# round trip while neither the resolver index nor the async engine is enabled
+app.add_middleware(arks.resolve.RedirectMiddleware)
+
+
+if app.state.settings.info_cache_size > 0:
+    # Plain ASGI middleware, requests other than introspection pass through
+    # without a BaseHTTPMiddleware round trip
+    app.add_middleware(arks.introspection.InfoCacheMiddleware)
+
+
+if app.state.settings.negative_cache_size > 0 or app.state.settings.reject_unknown_naans:
+    app.add_middleware(arks.notfound.NotFoundMiddleware)
+
+
+async def prewarm_info(app: fastapi.FastAPI) -> None:
+    """Request the introspection document of each definition in-process.
+
+    Runs after startup and again after each registry update, so crawlers
+    walking /.info for every NAAN are answered from the info cache.
+    """
+    import httpx
+
+    L = get_logger()
+    interval = app.state.settings.registry_poll_interval
+    generation = arks.cache.MISSING
+    # Requests go to the transport directly, the client logs each request
+    transport = httpx.ASGITransport(app=app, client=(arks.ratelimit.INTERNAL_CLIENT, 0))
+    async with transport:
+        while True:
+            if app.state.registry_updated != generation:
+                generation = app.state.registry_updated
+                entries = app.state.resolver_index
+                if entries is None:
+                    entries = await asyncio.to_thread(load_index_entries, app.state.dbengine)
+                t0 = time.perf_counter()
+                n = 0
+                for path in arks.introspection.prewarm_paths(entries):
+                    try:
+                        response = await transport.handle_async_request(
+                            httpx.Request("GET", f"http://localhost{path}")
+                        )
+                        await response.aclose()
+                    except Exception as e:
+                        L.debug("Prewarm of %s failed: %s", path, e)
+                    n += 1
+                L.info("Prewarmed %s introspection responses in %.3f s", n, time.perf_counter() - t0)
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+
+if app.state.settings.profile_enabled:
+    # Only imported when enabled, cProfile and pstats are not needed otherwise
+    import arks.profiling
+
+    app.state.trace_ring = arks.profiling.TraceRing(
+        app.state.settings.profile_dir, app.state.settings.profile_ring_size
+    )
+
+    @app.middleware("http")
+    async def profile_middleware(request: fastapi.Request, call_next):
+        """Keep a trace of requests that are slow or sampled for profiling."""
+        settings = request.app.state.settings
+        sampled = random.random() < settings.profile_sample_rate
+        with arks.profiling.trace_request(sampled) as trace:
+            response = await call_next(request)
+        if trace["profile"] is not None or trace["elapsed_ms"] >= settings.profile_threshold_ms:
+            summary = {
+                "time": time.time(),
+                "method": request.method,
+                "path": request.url.path,
+                "query": request.url.query,
+                "status": response.status_code,
+                "elapsed_ms": trace["elapsed_ms"],
+                "statements": trace["statements"],
+                "overlapping": trace["overlapping"],
+            }
+            try:
+                await asyncio.to_thread(request.app.state.trace_ring.write, summary, trace["profile"])
+            except OSError as e:
+                get_logger().warning("Unable to write request trace: %s", e)
         return response
 
 
+if app.state.settings.rate_limit_rate > 0 or app.state.settings.max_inflight > 0:
+
+    @app.middleware("http")
+    async def rate_limit_middleware(request: fastapi.Request, call_next):
+        """Limit the request rate of each client and the requests in process.
+
+        Registered last before CORS so that it runs ahead of all other work and
+        its 429 and 503 responses still carry CORS headers.
+        """
+        state = request.app.state
+        settings = state.settings
+        peer = request.client.host if request.client is not None else None
+        if peer == arks.ratelimit.INTERNAL_CLIENT:
+            return await call_next(request)
+        client = arks.ratelimit.client_address(
+            peer,
+            request.headers.get("x-forwarded-for"),
+            settings.rate_limit_proxy_count,
+        )
+        if client in state.rate_limit_exempt:
+            return await call_next(request)
+        if state.rate_limiter is not None:
+            wait = state.rate_limiter.acquire(client)
+            if wait > 0:
+                state.rate_limited += 1
+                return fastapi.responses.JSONResponse(
+                    {"detail": "Too Many Requests"},
+                    status_code=429,
+                    headers={"Retry-After": str(math.ceil(wait))},
+                )
+        if 0 < settings.max_inflight <= state.inflight:
+            state.shed += 1
+            return fastapi.responses.JSONResponse(
+                {"detail": "Service Unavailable"},
+                status_code=503,
+                headers={"Retry-After": "1"},
+            )
+        state.inflight += 1
+        try:
+            return await call_next(request)
+        finally:
+            state.inflight -= 1
+
+
+# Enables CORS for UIs on different domains. Added after the other middleware
+# so that it wraps them and responses answered early still carry CORS headers.
+app.add_middleware(
+    fastapi.middleware.cors.CORSMiddleware,
+    allow_origins=["*", ],
+    allow_credentials=True,
+    allow_methods=["*", ],
+    allow_headers=["*", ],
+)
+
 
 app.mount(
     "/static",
@@ -115,52 +474,128 @@ app.mount(
 )
 
 
-templates = fastapi.templating.Jinja2Templates(
-    directory=app.state.settings.template_dir
-)
-
-templates.env.globals.setdefault("relurl_for", get_relative_url_for)
-
-
 @app.get("/favicon.ico", include_in_schema=False)
 async def get_favicon():
     raise fastapi.HTTPException(status_code=404, detail="Not found")
 
 
+def get_pages() -> typing.Dict[str, arks.pages.RenderedPage]:
+    """Pages rendered once per process for this environment and version.
+
+    Rendered on the first page request rather than at startup, so workers
+    that only serve redirects never load jinja2.
+    """
+    if app.state.pages is None:
+        import fastapi.templating
+
+        templates = fastapi.templating.Jinja2Templates(
+            directory=app.state.settings.template_dir
+        )
+        templates.env.globals.setdefault("relurl_for", get_relative_url_for)
+        app.state.pages = arks.pages.render_pages(
+            templates.env,
+            {
+                "environment": app.state.settings.environment,
+                "version": __version__,
+            },
+        )
+    return app.state.pages
+
+
 @app.get("/", include_in_schema=False)
 async def redirect_docs(request: fastapi.Request):
-    return templates.TemplateResponse(
-        "index.html",
-        {
-            "request": request,
-            "environment": app.state.settings.environment,
-            "version": __version__,
-        },
-    )
+    return arks.pages.page_response(get_pages()["index.html"], request)
 
 
 @app.get("/_{page:path}", include_in_schema=False)
 async def human_pages(request: fastapi.Request, page: str):
-    L = get_logger()
+    pages = get_pages()
+    rendered = pages.get(page)
+    if rendered is not None:
+        return arks.pages.page_response(rendered, request)
+    # Unknown names are common from scanners, so no traceback here.
+    get_logger().debug("No page named %s", page)
+    return arks.pages.page_response(pages[arks.pages.NOT_FOUND_PAGE], request, status_code=404)
+
+
+def read_batch_identifiers(body: bytes, content_type: str) -> typing.List[str]:
+    """Identifiers from a JSON list or an NDJSON body of one JSON string per line."""
+    if content_type.startswith(("application/x-ndjson", "application/jsonl")):
+        identifiers = [json.loads(line) for line in body.splitlines() if line.strip()]
+    else:
+        identifiers = json.loads(body)
+        if not isinstance(identifiers, list):
+            raise ValueError("Expected a JSON list of identifiers")
+    for i, identifier in enumerate(identifiers):
+        if not isinstance(identifier, str):
+            raise ValueError(f"Identifier {i} is not a string")
+    return identifiers
+
+
+def iter_ndjson_chunks(
+    results: typing.Iterable[typing.Dict[str, typing.Any]], lines: int = BATCH_CHUNK_LINES
+) -> typing.Iterator[bytes]:
+    """NDJSON of results, joined into chunks of up to lines lines."""
+    buf = []
+    for res in results:
+        buf.append(json.dumps(res))
+        if len(buf) >= lines:
+            yield ("\n".join(buf) + "\n").encode("utf-8")
+            buf = []
+    if buf:
+        yield ("\n".join(buf) + "\n").encode("utf-8")
+
+
+def iter_batch_ndjson(
+    state: typing.Any, identifiers: typing.List[str]
+) -> typing.Iterator[bytes]:
+    """Resolve identifiers against one index snapshot or one DB session.
+
+    Run in the threadpool by StreamingResponse, one hop per chunk.
+    """
+    match_args = {
+        "auto_introspection": state.settings.auto_introspection,
+        "known": state.known_prefixes,
+    }
+    index = state.resolver_index
+    if index is not None:
+        yield from iter_ndjson_chunks(
+            arks.resolve.iter_batch(identifiers, index.lookup, state.identifier_splitter, **match_args)
+        )
+        return
+    # The request scoped session is closed before the response streams,
+    # so the batch holds its own.
+    with get_dbsession(state.dbengine) as dbsession:
+        lookup = functools.partial(arks.index.lookup_entry, dbsession)
+        yield from iter_ndjson_chunks(
+            arks.resolve.iter_batch(identifiers, lookup, state.identifier_splitter, **match_args)
+        )
+
+
+@app.post("/api/v1/resolve")
+async def batch_resolve(request: fastapi.Request):
+    """Match a list of identifiers to their definitions.
+
+    The body is a JSON list of identifiers, or NDJSON with one JSON string
+    per line. The response is NDJSON with the pid, expanded target,
+    http_code and matched definition uniq of each identifier, in order.
+    The same rules as resolve requests apply to auto introspection and
+    unregistered NAANs.
+    """
     try:
-        return templates.TemplateResponse(
-            page,
-            {
-                "request": request,
-                "environment": app.state.settings.environment,
-                "version": __version__,
-            },
+        identifiers = read_batch_identifiers(
+            await request.body(), request.headers.get("content-type", "")
         )
-    except Exception as e:
-        L.exception(e)
-    return templates.TemplateResponse(
-        "404.html",
-        {
-            "request": request,
-            "environment": app.state.settings.environment,
-            "version": __version__,
-        },
-        status_code=404,
+    except ValueError as e:
+        raise fastapi.HTTPException(status_code=400, detail=str(e))
+    if len(identifiers) > app.state.settings.batch_max_pids:
+        raise fastapi.HTTPException(
+            status_code=413,
+            detail=f"At most {app.state.settings.batch_max_pids} identifiers per request",
+        )
+    return fastapi.responses.StreamingResponse(
+        iter_batch_ndjson(request.app.state, identifiers),
+        media_type="application/x-ndjson",
     )
 
 
@@ -170,6 +605,57 @@ if app.state.settings.allow_appinfo:
         return app.state.settings
 
 
+if app.state.settings.allow_metrics:
+    arks.metrics.registry.counter(
+        "arks_resolve_cache_hits_total",
+        "Early resolve cache hits.",
+        lambda: app.state.resolve_cache.hits,
+    )
+    arks.metrics.registry.counter(
+        "arks_resolve_cache_misses_total",
+        "Early resolve cache misses.",
+        lambda: app.state.resolve_cache.misses,
+    )
+    arks.metrics.registry.counter(
+        "arks_info_cache_hits_total",
+        "Introspection response cache hits.",
+        lambda: app.state.info_cache.hits,
+    )
+    arks.metrics.registry.counter(
+        "arks_info_cache_misses_total",
+        "Introspection response cache misses.",
+        lambda: app.state.info_cache.misses,
+    )
+    arks.metrics.registry.counter(
+        "arks_negative_cache_hits_total",
+        "Not found response cache hits.",
+        lambda: app.state.negative_cache.hits,
+    )
+    arks.metrics.registry.counter(
+        "arks_unknown_naan_rejects_total",
+        "Requests rejected for an unregistered NAAN.",
+        lambda: app.state.unknown_naan_rejects,
+    )
+    arks.metrics.registry.counter(
+        "arks_rate_limited_total",
+        "Requests answered 429 by the per client rate limit.",
+        lambda: app.state.rate_limited,
+    )
+    arks.metrics.registry.counter(
+        "arks_shed_total",
+        "Requests answered 503 over the in-process request limit.",
+        lambda: app.state.shed,
+    )
+
+    @app.get("/api/v1/metrics", include_in_schema=False)
+    async def app_metrics(request: fastapi.Request):
+        """Metrics of the worker process answering the request."""
+        return fastapi.responses.PlainTextResponse(
+            arks.metrics.registry.render(),
+            media_type="text/plain; version=0.0.4",
+        )
+
+
 app.include_router(
     rslv.routers.resolver.router,
 )
@@ -0,0 +1,157 @@
+"""In-process latency and throughput measurement of the resolver app.
+
+Requests are sent to the ASGI app through httpx's ASGI transport, so the
+numbers cover the application stack without network or server overhead.
+"""
+
+import asyncio
+import contextlib
+import math
+import random
+import re
+import time
+import typing
+
+import fastapi
+import httpx
+
+import arks.ratelimit
+
+# Relative frequency of each kind of request in a generated workload
+WORKLOAD_MIX = {
+    "naan": 40,
+    "shoulder": 30,
+    "miss": 10,
+    "introspection": 10,
+    "service": 10,
+}
+
+
+def percentile(values: typing.Sequence[float], p: float) -> float:
+    """Nearest rank percentile of already sorted values."""
+    if not values:
+        return 0.0
+    rank = math.ceil(p / 100.0 * len(values)) - 1
+    return values[max(0, min(len(values) - 1, rank))]
+
+
+def summarize(latencies: typing.List[float], elapsed: typing.Optional[float] = None) -> typing.Dict[str, float]:
+    """Count, rate and latency distribution in milliseconds of latencies in seconds."""
+    values = sorted(latencies)
+    res = {
+        "count": len(values),
+        "mean_ms": round(1000.0 * sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(1000.0 * percentile(values, 50), 3),
+        "p95_ms": round(1000.0 * percentile(values, 95), 3),
+        "p99_ms": round(1000.0 * percentile(values, 99), 3),
+        "max_ms": round(1000.0 * values[-1], 3) if values else 0.0,
+    }
+    if elapsed:
+        res["requests_per_sec"] = round(len(values) / elapsed, 1)
+    return res
+
+
+@contextlib.asynccontextmanager
+async def app_client(
+    app: fastapi.FastAPI, base_url: str = "http://arks.test"
+) -> typing.AsyncIterator[httpx.AsyncClient]:
+    """Client for app in-process, with the app lifespan run around it."""
+    async with app.router.lifespan_context(app):
+        # Requests from INTERNAL_CLIENT are not rate limited
+        transport = httpx.ASGITransport(app=app, client=(arks.ratelimit.INTERNAL_CLIENT, 0))
+        async with httpx.AsyncClient(transport=transport, base_url=base_url) as client:
+            yield client
+
+
+def build_workload(
+    records: typing.Iterable[typing.Dict[str, typing.Any]],
+    count: int,
+    service_url: typing.Optional[str] = None,
+    seed: int = 0
+) -> typing.List[typing.Tuple[str, str]]:
+    """Generate (kind, path) requests from NAAN records.
+
+    NAANs are drawn with a Zipf like skew so a few are hot, as in production.
+    The "service" kind is only generated when service_url is provided.
+    """
+    rnd = random.Random(seed)
+    naans = []
+    shoulders = []
+    for record in records:
+        if record.get("rtype") == "PublicNAAN":
+            naans.append(record["what"])
+        elif record.get("rtype") == "PublicNAANShoulder":
+            shoulders.append((record["naan"], record["shoulder"]))
+    if not naans:
+        raise ValueError("No NAAN records to build a workload from")
+    mix = {k: v for k, v in WORKLOAD_MIX.items() if v > 0}
+    if service_url is None:
+        mix.pop("service", None)
+    if not shoulders:
+        mix.pop("shoulder", None)
+    known = set(naans)
+    naan_weights = [1.0 / (rank + 1) for rank in range(len(naans))]
+    shoulder_weights = [1.0 / (rank + 1) for rank in range(len(shoulders))]
+    kinds = rnd.choices(list(mix.keys()), weights=list(mix.values()), k=count)
+    workload = []
+    for kind in kinds:
+        suffix = f"b{rnd.randrange(10**6):06d}"
+        if kind == "shoulder":
+            naan, shoulder = rnd.choices(shoulders, weights=shoulder_weights)[0]
+            path = f"/ark:/{naan}/{shoulder}{suffix}"
+        elif kind == "miss":
+            naan = f"{rnd.randrange(10**5):05d}"
+            while naan in known:
+                naan = f"{rnd.randrange(10**5):05d}"
+            path = f"/ark:/{naan}/{suffix}"
+        else:
+            naan = rnd.choices(naans, weights=naan_weights)[0]
+            if kind == "introspection":
+                path = f"/.info/ark:/{naan}"
+            elif kind == "service":
+                path = f"/{service_url}ark:/{naan}/{suffix}"
+            else:
+                path = f"/ark:/{naan}/{suffix}"
+        workload.append((kind, path))
+    return workload
+
+
+def service_url_for(service_pattern: typing.Optional[str], service_url: str) -> typing.Optional[str]:
+    """service_url if it is matched by service_pattern, else None."""
+    if not service_pattern or re.match(service_pattern, service_url) is None:
+        return None
+    return service_url
+
+
+async def run_workload(
+    client: httpx.AsyncClient,
+    workload: typing.List[typing.Tuple[str, str]],
+    concurrency: int = 10
+) -> typing.Dict[str, typing.Any]:
+    """Send the workload with concurrency requests in flight and summarize.
+
+    Returns {"overall": summary, "kinds": {kind: summary}, "status": {code: count}}.
+    """
+    queue = list(reversed(workload))
+    latencies: typing.Dict[str, typing.List[float]] = {}
+    status: typing.Dict[str, int] = {}
+
+    async def _worker():
+        while queue:
+            kind, path = queue.pop()
+            t0 = time.perf_counter()
+            response = await client.get(path)
+            dt = time.perf_counter() - t0
+            latencies.setdefault(kind, []).append(dt)
+            code = str(response.status_code)
+            status[code] = status.get(code, 0) + 1
+
+    t_start = time.perf_counter()
+    await asyncio.gather(*[_worker() for _ in range(max(1, concurrency))])
+    elapsed = time.perf_counter() - t_start
+    overall = [dt for values in latencies.values() for dt in values]
+    return {
+        "overall": summarize(overall, elapsed),
+        "kinds": {kind: summarize(values) for kind, values in sorted(latencies.items())},
+        "status": dict(sorted(status.items())),
+    }
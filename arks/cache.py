@@ -0,0 +1,107 @@
+"""Small in-process caches used on the request path."""
+
+import collections
+import time
+import typing
+
+MISSING = object()
+
+
+class TTLCache:
+    """Bounded LRU mapping with per-entry expiry and registry generation.
+
+    Entries expire ttl seconds after being set, and all entries are dropped
+    when get or set is called with a generation different from the one the
+    entries were stored under, e.g. the registry "updated" timestamp.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        clock: typing.Callable[[], float] = time.monotonic
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: "collections.OrderedDict[typing.Any, typing.Tuple[float, typing.Any]]" = collections.OrderedDict()
+        self._generation: typing.Any = None
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _check_generation(self, generation: typing.Any) -> None:
+        if generation != self._generation:
+            self._data.clear()
+            self._generation = generation
+
+    def get(self, key: typing.Hashable, generation: typing.Any = None, default: typing.Any = MISSING) -> typing.Any:
+        self._check_generation(generation)
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+        expires, value = item
+        if expires < self._clock():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: typing.Hashable, value: typing.Any, generation: typing.Any = None) -> None:
+        if self.maxsize <= 0:
+            return
+        self._check_generation(generation)
+        self._data[key] = (self._clock() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+def buffered_send(
+    send: typing.Callable,
+    keep: typing.Callable[[typing.Dict[str, typing.Any]], bool],
+    max_size: int,
+    complete: typing.Callable[[typing.Dict[str, typing.Any], bytes], typing.Awaitable[None]]
+) -> typing.Callable:
+    """Wrap an ASGI send to hold back a response for caching.
+
+    Responses whose http.response.start message keep accepts are buffered
+    and, once the body is complete, passed to complete(start, body) which
+    sends them. Other responses, and those whose body grows beyond max_size,
+    are sent through as they come.
+    """
+    start = None
+    chunks: typing.List[bytes] = []
+    size = 0
+    passthrough = False
+
+    async def _send(message):
+        nonlocal start, size, passthrough
+        if passthrough:
+            return await send(message)
+        if message["type"] == "http.response.start":
+            if not keep(message):
+                passthrough = True
+                return await send(message)
+            start = message
+            return
+        body = message.get("body", b"")
+        chunks.append(body)
+        size += len(body)
+        if size > max_size:
+            # Too large to cache, send what was held back and stream the rest
+            passthrough = True
+            await send(start)
+            return await send(dict(message, body=b"".join(chunks)))
+        if not message.get("more_body", False):
+            await complete(start, b"".join(chunks))
+
+    return _send
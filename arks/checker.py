@@ -0,0 +1,220 @@
+"""Health checks of definition target URLs.
+
+Each NAAN and shoulder target template is expanded for a probe identifier
+and requested through a shared, pooled httpx.AsyncClient. The number of
+requests in flight is bounded overall and per target host, and results are
+handed to a callback as each check completes.
+"""
+
+import asyncio
+import collections
+import dataclasses
+import datetime
+import logging
+import time
+import typing
+import urllib.parse
+
+import httpx
+import rslv.lib_rslv
+
+from arks import APP_NAME
+from arks.index import IndexEntry
+
+
+# Targets held back while their host is at per_host before workers wait for
+# a check to finish instead of reading further targets
+MAX_DEFERRED = 10000
+
+
+def get_logger():
+    return logging.getLogger(APP_NAME)
+
+
+@dataclasses.dataclass
+class URL:
+    target: str
+
+    def __eq__(self, other: 'URL') -> bool:
+        if self.target == other.target:
+            return True
+        return False
+
+    def __str__(self) -> str:
+        return self.target
+
+
+@dataclasses.dataclass
+class HttpResponse:
+    start_url: URL
+    final_url: typing.Optional[URL] = None
+    status_code: typing.Optional[int] = 0
+    # Time from sending the first request to the final response
+    msecs: typing.Optional[float] = 0
+    error: typing.Optional[str] = None
+
+
+async def follow_redirects_until(
+        client: httpx.AsyncClient,
+        url: str,
+        headers: typing.Dict[str, str],
+        stop_hosts: typing.Optional[typing.List[str]] = None,
+        follow_all: bool = False,
+        max_redirects: int = 10
+    ) -> HttpResponse:
+    """Request url, following redirects to URLs starting with a stop_hosts entry.
+
+    The first redirect elsewhere is not followed, its location is the
+    final_url and its status the status_code. With follow_all, every redirect
+    is followed. Response bodies are not read.
+    """
+    L = get_logger()
+    if stop_hosts is None:
+        stop_hosts = []
+    visited = [url]
+    result = HttpResponse(start_url=URL(url))
+    t0 = time.perf_counter()
+    try:
+        req = client.build_request("GET", url, headers=headers)
+        while True:
+            L.debug("Send %s", req.url)
+            response = await client.send(req, stream=True)
+            await response.aclose()
+            result.status_code = response.status_code
+            result.final_url = URL(str(response.url))
+            req = response.next_request
+            if req is None:
+                break
+            _url = str(req.url)
+            result.final_url = URL(_url)
+            if not (follow_all or _url.startswith(tuple(stop_hosts))):
+                break
+            if _url in visited:
+                raise ValueError(f"Redirect loop for {_url}")
+            if len(visited) > max_redirects:
+                raise ValueError(f"More than {max_redirects} redirects")
+            visited.append(_url)
+    except Exception as e:
+        L.debug("Request for %s failed: %s", url, e)
+        result.error = str(e) or type(e).__name__
+    result.msecs = round(1000.0 * (time.perf_counter() - t0), 3)
+    return result
+
+
+class Target(typing.NamedTuple):
+    uniq: str
+    url: str
+
+
+def iter_targets(
+    entries: typing.Iterable[IndexEntry], probe_value: str = ""
+) -> typing.Iterator[Target]:
+    """Target URLs of NAAN and shoulder definitions expanded for a probe identifier.
+
+    The probe identifier is the definition's prefix and value followed by
+    probe_value. Scheme level, synonym and non HTTP targets are skipped.
+    """
+    for entry in entries:
+        if not entry.prefix or entry.synonym_for is not None or not entry.target:
+            continue
+        identifier = f"{entry.scheme}:/{entry.prefix}/{entry.value or ''}{probe_value}"
+        pid_parts = rslv.lib_rslv.split_identifier_string(identifier)
+        url = rslv.lib_rslv.unsplit_identifier_string(entry.target, pid_parts)
+        if not url.startswith(("http://", "https://")):
+            continue
+        yield Target(entry.uniq, url)
+
+
+async def check_targets(
+    targets: typing.Iterable[Target],
+    on_result: typing.Callable[[typing.Dict[str, typing.Any]], None],
+    concurrency: int = 20,
+    per_host: int = 2,
+    timeout: float = 10.0,
+    follow_all: bool = False,
+    headers: typing.Optional[typing.Dict[str, str]] = None,
+    client: typing.Optional[httpx.AsyncClient] = None
+) -> typing.Dict[str, int]:
+    """Check targets, calling on_result with each result as it completes.
+
+    A target whose host already has per_host checks in flight is held back
+    and the next target taken instead, so runs of targets on one host do not
+    stall the other workers.
+
+    Returns counts of results by status code, or "error".
+    """
+    if headers is None:
+        headers = {}
+    targets = iter(targets)
+    # Checks in flight and held back targets per host
+    active: typing.Dict[str, int] = {}
+    deferred: typing.Dict[str, typing.Deque[Target]] = {}
+    n_deferred = 0
+    finished = asyncio.Condition()
+    counts: typing.Dict[str, int] = {}
+
+    def _next() -> typing.Optional[typing.Tuple[str, Target]]:
+        """The next target whose host is below per_host, None if there is none yet."""
+        nonlocal n_deferred
+        for host, queue in deferred.items():
+            if active.get(host, 0) < per_host:
+                target = queue.popleft()
+                if not queue:
+                    del deferred[host]
+                n_deferred -= 1
+                return host, target
+        if n_deferred >= MAX_DEFERRED:
+            return None
+        for target in targets:
+            host = urllib.parse.urlsplit(target.url).netloc.lower()
+            if active.get(host, 0) < per_host:
+                return host, target
+            deferred.setdefault(host, collections.deque()).append(target)
+            n_deferred += 1
+            if n_deferred >= MAX_DEFERRED:
+                break
+        return None
+
+    async def _worker(client: httpx.AsyncClient) -> None:
+        while True:
+            async with finished:
+                item = _next()
+                while item is None:
+                    if not deferred:
+                        return
+                    await finished.wait()
+                    item = _next()
+            host, target = item
+            active[host] = active.get(host, 0) + 1
+            try:
+                res = await follow_redirects_until(
+                    client, target.url, headers, follow_all=follow_all
+                )
+            finally:
+                active[host] -= 1
+                async with finished:
+                    finished.notify_all()
+            key = "error" if res.error is not None else str(res.status_code)
+            counts[key] = counts.get(key, 0) + 1
+            on_result({
+                "uniq": target.uniq,
+                "url": target.url,
+                "final_url": None if res.final_url is None else str(res.final_url),
+                "status_code": None if res.error is not None else res.status_code,
+                "msecs": res.msecs,
+                "error": res.error,
+                "checked_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            })
+
+    async def _run(client: httpx.AsyncClient) -> None:
+        await asyncio.gather(*[_worker(client) for _ in range(max(1, concurrency))])
+
+    if client is not None:
+        await _run(client)
+    else:
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(
+            limits=limits, timeout=httpx.Timeout(timeout), follow_redirects=False
+        ) as client:
+            await _run(client)
+    return dict(sorted(counts.items()))
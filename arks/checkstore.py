@@ -0,0 +1,239 @@
+"""Stored target check results for incremental, resumable check runs.
+
+Results are committed as checks complete, so an interrupted run keeps its
+progress and a re-run skips targets checked within a freshness window.
+Hosts failing every check of a run are backed off for exponentially
+longer periods, and a run can be limited to definitions that changed since
+they were last checked.
+"""
+
+import datetime
+import os
+import typing
+import urllib.parse
+
+import sqlalchemy
+import sqlalchemy.orm
+
+import arks.checker
+import arks.db
+import arks.naans
+
+_metadata = sqlalchemy.MetaData()
+
+# Latest check result of each target, keyed by definition uniq
+target_checks = sqlalchemy.Table(
+    "arks_target_check",
+    _metadata,
+    sqlalchemy.Column("uniq", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("url", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("final_url", sqlalchemy.String),
+    sqlalchemy.Column("status_code", sqlalchemy.Integer),
+    sqlalchemy.Column("msecs", sqlalchemy.Float),
+    sqlalchemy.Column("error", sqlalchemy.String),
+    sqlalchemy.Column("checked_at", sqlalchemy.DateTime, nullable=False),
+)
+
+# Hosts skipped until retry_after after failing failures runs in a row
+host_backoff = sqlalchemy.Table(
+    "arks_host_backoff",
+    _metadata,
+    sqlalchemy.Column("host", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("failures", sqlalchemy.Integer, nullable=False),
+    sqlalchemy.Column("retry_after", sqlalchemy.DateTime, nullable=False),
+)
+
+# Back off period after the first failed run, doubled per failed run
+BACKOFF_BASE = datetime.timedelta(hours=1)
+BACKOFF_MAX = datetime.timedelta(days=7)
+# Results committed per transaction
+COMMIT_EVERY = 50
+# Store file created next to a SQLite registry
+STORE_FILENAME = "target_checks.sqlite"
+
+
+def sqlite_path(url: sqlalchemy.engine.URL) -> typing.Optional[str]:
+    """File path of a SQLite database URL, None for other URLs."""
+    if not arks.db.is_sqlite(url) or not url.database or url.database == ":memory:":
+        return None
+    database = url.database
+    if database.startswith("file:"):
+        database = database[len("file:"):].partition("?")[0]
+    return database
+
+
+def default_store_url(dbcnstr: str) -> str:
+    """URL of the store file in the folder of the SQLite registry at dbcnstr."""
+    path = sqlite_path(sqlalchemy.engine.make_url(dbcnstr))
+    if path is None:
+        raise ValueError("target_checks_db must be set for a registry that is not a SQLite file")
+    return f"sqlite:///{os.path.join(os.path.dirname(os.path.abspath(path)), STORE_FILENAME)}"
+
+
+def target_host(url: str) -> str:
+    return urllib.parse.urlsplit(url).netloc.lower()
+
+
+def is_host_failure(result: typing.Dict[str, typing.Any]) -> bool:
+    """True if the host did not answer or answered with a server error."""
+    return result["error"] is not None or (result["status_code"] or 0) >= 500
+
+
+def backoff_period(failures: int) -> datetime.timedelta:
+    return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** max(0, failures - 1))
+
+
+def load_record_updates(session: sqlalchemy.orm.Session) -> typing.Dict[str, datetime.datetime]:
+    """{uniq: time the definition last changed} from the registry record digests."""
+    digests = arks.naans.record_digests
+    return dict(session.execute(sqlalchemy.select(digests.c.uniq, digests.c.updated)).all())
+
+
+class CheckStore:
+    """SQLite store of target check results and host back off state."""
+
+    def __init__(self, dbcnstr: str):
+        path = sqlite_path(sqlalchemy.engine.make_url(dbcnstr))
+        if path is not None and os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._engine = arks.db.get_writer_engine(dbcnstr)
+        _metadata.create_all(self._engine)
+        self._session = sqlalchemy.orm.Session(self._engine)
+        self._pending = 0
+
+    def last_checks(self) -> typing.Dict[str, datetime.datetime]:
+        """{uniq: checked_at} of stored results."""
+        rows = self._session.execute(sqlalchemy.select(target_checks.c.uniq, target_checks.c.checked_at))
+        return dict(rows.all())
+
+    def backoff(self) -> typing.Dict[str, typing.Tuple[int, datetime.datetime]]:
+        """{host: (failures, retry_after)} of backed off hosts."""
+        rows = self._session.execute(
+            sqlalchemy.select(host_backoff.c.host, host_backoff.c.failures, host_backoff.c.retry_after)
+        )
+        return {host: (failures, retry_after) for host, failures, retry_after in rows}
+
+    def add_result(self, result: typing.Dict[str, typing.Any]) -> None:
+        checked_at = datetime.datetime.fromisoformat(result["checked_at"])
+        if checked_at.tzinfo is not None:
+            # Stored as local time like the registry record digests
+            checked_at = checked_at.astimezone().replace(tzinfo=None)
+        values = {k: result[k] for k in ("url", "final_url", "status_code", "msecs", "error")}
+        self._session.execute(target_checks.delete().where(target_checks.c.uniq == result["uniq"]))
+        self._session.execute(
+            target_checks.insert().values(uniq=result["uniq"], checked_at=checked_at, **values)
+        )
+        self._pending += 1
+        if self._pending >= COMMIT_EVERY:
+            self.commit()
+
+    def update_hosts(
+        self, outcomes: typing.Dict[str, bool], now: datetime.datetime
+    ) -> None:
+        """Record run outcomes, {host: True if any check of the host succeeded}."""
+        current = self.backoff()
+        for host, ok in outcomes.items():
+            self._session.execute(host_backoff.delete().where(host_backoff.c.host == host))
+            if ok:
+                continue
+            failures = current.get(host, (0, now))[0] + 1
+            self._session.execute(
+                host_backoff.insert().values(
+                    host=host, failures=failures, retry_after=now + backoff_period(failures)
+                )
+            )
+        self.commit()
+
+    def commit(self) -> None:
+        self._session.commit()
+        self._pending = 0
+
+    def close(self) -> None:
+        self.commit()
+        self._session.close()
+        self._engine.dispose()
+
+
+def select_targets(
+    targets: typing.Iterable[arks.checker.Target],
+    last_checks: typing.Dict[str, datetime.datetime],
+    backoff: typing.Dict[str, typing.Tuple[int, datetime.datetime]],
+    now: datetime.datetime,
+    max_age: typing.Optional[datetime.timedelta] = None,
+    record_updates: typing.Optional[typing.Dict[str, datetime.datetime]] = None,
+    skipped: typing.Optional[typing.Dict[str, int]] = None
+) -> typing.Iterator[arks.checker.Target]:
+    """Targets due for a check.
+
+    Targets checked within max_age are skipped unless their definition
+    changed after the check. With record_updates, only targets whose
+    definition changed since they were last checked are selected. Targets on
+    backed off hosts are skipped. Skip counts by reason are added to skipped.
+    """
+    if skipped is None:
+        skipped = {}
+    for target in targets:
+        checked_at = last_checks.get(target.uniq)
+        changed = None
+        if checked_at is not None and record_updates is not None:
+            updated = record_updates.get(target.uniq)
+            changed = updated is not None and updated > checked_at
+            if not changed:
+                skipped["unchanged"] = skipped.get("unchanged", 0) + 1
+                continue
+        if checked_at is not None and max_age is not None and not changed:
+            if now - checked_at < max_age:
+                skipped["fresh"] = skipped.get("fresh", 0) + 1
+                continue
+        host_state = backoff.get(target_host(target.url))
+        if host_state is not None and host_state[1] > now:
+            skipped["backoff"] = skipped.get("backoff", 0) + 1
+            continue
+        yield target
+
+
+async def run_checks(
+    store: CheckStore,
+    targets: typing.Iterable[arks.checker.Target],
+    on_result: typing.Callable[[typing.Dict[str, typing.Any]], None],
+    max_age: typing.Optional[datetime.timedelta] = None,
+    record_updates: typing.Optional[typing.Dict[str, datetime.datetime]] = None,
+    max_host_failures: int = 3,
+    **check_args: typing.Any
+) -> typing.Dict[str, typing.Any]:
+    """Check targets due for a check, storing each result.
+
+    Within the run, the remaining targets of a host are skipped once it has
+    failed max_host_failures checks without a success. check_args are
+    passed to arks.checker.check_targets.
+
+    Returns {"status": counts by status, "skipped": counts by reason}.
+    """
+    now = datetime.datetime.now()
+    skipped: typing.Dict[str, int] = {}
+    # {host: [failures, successes]} in this run
+    hosts: typing.Dict[str, typing.List[int]] = {}
+
+    def _due() -> typing.Iterator[arks.checker.Target]:
+        for target in select_targets(
+            targets, store.last_checks(), store.backoff(), now,
+            max_age=max_age, record_updates=record_updates, skipped=skipped,
+        ):
+            failures, successes = hosts.get(target_host(target.url), (0, 0))
+            if successes == 0 and failures >= max_host_failures:
+                skipped["host_failing"] = skipped.get("host_failing", 0) + 1
+                continue
+            yield target
+
+    def _on_result(result: typing.Dict[str, typing.Any]) -> None:
+        counts = hosts.setdefault(target_host(result["url"]), [0, 0])
+        counts[0 if is_host_failure(result) else 1] += 1
+        store.add_result(result)
+        on_result(result)
+
+    try:
+        status = await arks.checker.check_targets(_due(), _on_result, **check_args)
+    finally:
+        store.commit()
+    store.update_hosts({host: counts[1] > 0 for host, counts in hosts.items()}, now)
+    return {"status": status, "skipped": dict(sorted(skipped.items()))}
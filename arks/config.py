@@ -22,18 +22,52 @@ class Settings(rslv.config.Settings):
     devhost: str = "localhost"
     # Port for the development server
     devport: int = 8000
+    # Address and number of worker processes of the prefork production server
+    serve_host: str = "127.0.0.1"
+    serve_port: int = 18880
+    serve_workers: int = 4
     # Sqlalchemy database connection string for the registry configuration
     db_connection_string: str = f"sqlite:///{BASE_FOLDER}/data/registry.sqlite"
     # Label for the type of environment we are running under, e.g. "development", "production"
     environment: str = "production"
     # Allow application information to be exposed in the api
     allow_appinfo: bool = False
+    # Expose per-process request path metrics at /api/v1/metrics
+    allow_metrics: bool = False
     # Path to logfile, fall back to stderr if None
     log_filename: typing.Optional[str] = None
     log_level: str = "info"
     log_format: str = logging.BASIC_FORMAT
+    # Use the async driver (e.g. aiosqlite) for redirect lookups so that
+    # database I/O does not block the event loop.
+    db_async: bool = False
+    # Open a SQLite registry read-only in the app. load-naans writes in WAL
+    # mode, so read-only workers are not blocked while it runs.
+    db_readonly: bool = False
+    # SQLite pragmas for app connections: bytes of the registry file memory
+    # mapped, and page cache size (negative for KiB). 0 leaves the default.
+    sqlite_mmap_size: int = 64 * 1024 * 1024
+    sqlite_cache_size: int = -16000
+    # Maximum number of identifiers accepted by the batch resolve endpoint
+    batch_max_pids: int = 100000
+    # Database of check-targets results, kept apart from the registry. Default
+    # is target_checks.sqlite in the folder of a SQLite registry.
+    target_checks_db: typing.Optional[str] = None
+    # Hours after which check-targets checks a target again
+    target_check_max_age: float = 24.0
     # Log sql queries
     debug_sql: bool = False
+    # Keep traces of requests slower than profile_threshold_ms, with the SQL
+    # they issued. A profile_sample_rate fraction of requests is also run
+    # under cProfile, one at a time. The profile covers the event loop thread,
+    # so it includes other requests interleaved with the sampled one and misses
+    # sync handlers run in the threadpool. The newest profile_ring_size traces
+    # are kept in profile_dir.
+    profile_enabled: bool = False
+    profile_threshold_ms: float = 250.0
+    profile_sample_rate: float = 0.0
+    profile_dir: str = os.path.join(BASE_FOLDER, "data", "traces")
+    profile_ring_size: int = 100
     # Folder containing static content specific to this application.
     static_dir: str = os.path.join(BASE_FOLDER, "static")
     # Templates used by this application
@@ -44,10 +78,60 @@ class Settings(rslv.config.Settings):
     # match then trim the service url from the PID
     # For not uncommon situations where pid = "https://n2t.net/ark:/12345/foo"
     service_pattern: typing.Optional[str] = None
+    # Number of split identifiers memoized by the early resolve paths
+    pid_cache_size: int = 4096
+    # Number of early resolve outcomes cached, 0 disables the cache. Entries
+    # are dropped after resolve_cache_ttl seconds or when the registry is updated.
+    # Early resolve only runs with resolver_index, snapshot_path or db_async.
+    resolve_cache_size: int = 10000
+    resolve_cache_ttl: float = 300.0
+    # Cache-Control max-age of redirect responses answered early, 0 to omit.
+    # Redirects from the rslv router carry no ETag or Cache-Control.
+    redirect_max_age: int = 300
+    # Number of introspection responses (/.info, ?info) kept with their ETag and
+    # compressed variants, 0 disables. Dropped after info_cache_ttl seconds or
+    # when the registry is updated.
+    info_cache_size: int = 20000
+    info_cache_ttl: float = 3600.0
+    # Render the introspection response of every NAAN and shoulder in the
+    # background after startup and registry updates, filling the info cache.
+    info_prewarm: bool = False
+    # Number of not found responses to identifier requests cached, 0 disables.
+    # Dropped after negative_cache_ttl seconds or when the registry is updated.
+    negative_cache_size: int = 10000
+    negative_cache_ttl: float = 300.0
+    # Answer identifiers whose NAAN is not registered under a registered scheme
+    # with 404 before any database work, instead of falling back to the scheme
+    # level definition.
+    reject_unknown_naans: bool = False
+    # Requests per second allowed per client address with bursts of up to
+    # rate_limit_burst, answered 429 beyond that. 0 disables rate limiting.
+    rate_limit_rate: float = 0.0
+    rate_limit_burst: int = 50
+    # Number of client addresses tracked, the least recently seen are dropped
+    rate_limit_clients: int = 100000
+    # Number of proxies in front of the app appending to X-Forwarded-For. Clients
+    # are the address this many entries from the end, 0 uses the peer address.
+    rate_limit_proxy_count: int = 0
+    # Client addresses that are not rate limited. The in-process requests of
+    # bench, replay and prewarm never are.
+    rate_limit_exempt: typing.List[str] = []
+    # Requests handled at once by a worker before new ones are answered 503,
+    # 0 for no limit.
+    max_inflight: int = 0
     # If pid value matches the definition value, then assume introspection.
     # Note that this should be set False on services offering one-to-one matching of
     # definitions to PIDs. For N2T and arks.org this sould be true to match legacy behavior.
     auto_introspection: bool = True
+    # Hold the registry in an in-process index at startup and answer plain
+    # redirects from it without opening a database session.
+    resolver_index: bool = False
+    # Seconds between checks of the registry "updated" metadata. When it changes
+    # the resolver index is rebuilt in the background. 0 disables polling.
+    registry_poll_interval: float = 60.0
+    # Registry snapshot written by "arks export-snapshot". When set, the app maps
+    # the snapshot as its resolver index and remaps it when the file is replaced.
+    snapshot_path: typing.Optional[str] = None
 
 @functools.lru_cache
 def get_settings(env_file=None):
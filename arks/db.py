@@ -0,0 +1,212 @@
+"""Database engine and session handling for the resolver service."""
+
+import contextlib
+import functools
+import typing
+
+import sqlalchemy
+import sqlalchemy.event
+import sqlalchemy.ext.asyncio
+import sqlalchemy.orm
+import sqlalchemy.pool
+
+# Async drivers substituted for the default driver of a backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+}
+
+
+# Pragmas of connections that write the registry. WAL lets readers keep
+# reading while load-naans writes.
+WRITER_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 10000,
+}
+# Pooled connections kept for SQLite readers. Connections are cheap but hold
+# the page cache, so they are kept open rather than opened per checkout.
+SQLITE_POOL_SIZE = 10
+SQLITE_MAX_OVERFLOW = 30
+
+
+def is_sqlite(url: sqlalchemy.engine.URL) -> bool:
+    return url.get_backend_name() == "sqlite"
+
+
+def readonly_url(url: sqlalchemy.engine.URL) -> sqlalchemy.engine.URL:
+    """URL opening a SQLite database file read-only, other URLs unchanged.
+
+    The immutable flag is not used since load-naans updates the file in place.
+    """
+    if not is_sqlite(url) or not url.database or url.database == ":memory:":
+        return url
+    database = url.database
+    if not database.startswith("file:"):
+        database = f"file:{database}"
+    return url.set(database=database, query=dict(url.query, mode="ro", uri="true"))
+
+
+def set_sqlite_pragmas(engine: sqlalchemy.engine.Engine, pragmas: typing.Dict[str, typing.Any]) -> None:
+    """Apply pragmas to each new DBAPI connection of engine."""
+
+    @sqlalchemy.event.listens_for(engine, "connect")
+    def _connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def reader_pragmas(mmap_size: int, cache_size: int) -> typing.Dict[str, int]:
+    pragmas = {}
+    if mmap_size:
+        pragmas["mmap_size"] = mmap_size
+    if cache_size:
+        pragmas["cache_size"] = cache_size
+    return pragmas
+
+
+def _engine_args(
+    url: sqlalchemy.engine.URL, poolclass: typing.Type[sqlalchemy.pool.Pool] = sqlalchemy.pool.QueuePool
+) -> typing.Dict[str, typing.Any]:
+    if not is_sqlite(url):
+        return {"pool_pre_ping": True}
+    # A local SQLite file cannot go away under the pool, so skip the
+    # pre-ping round trip on every checkout.
+    if url.database and url.database != ":memory:":
+        return {
+            "poolclass": poolclass,
+            "pool_size": SQLITE_POOL_SIZE,
+            "max_overflow": SQLITE_MAX_OVERFLOW,
+        }
+    return {}
+
+
+@functools.lru_cache(maxsize=None)
+def get_engine(
+    dbcnstr: str,
+    readonly: bool = False,
+    mmap_size: int = 0,
+    cache_size: int = 0
+) -> sqlalchemy.engine.base.Engine:
+    """Engine for reading the registry.
+
+    For SQLite, readonly opens the file in read-only mode, and mmap_size and
+    cache_size are applied as pragmas on connect.
+    """
+    url = sqlalchemy.engine.make_url(dbcnstr)
+    if readonly:
+        url = readonly_url(url)
+    engine = sqlalchemy.create_engine(url, **_engine_args(url))
+    if is_sqlite(url):
+        set_sqlite_pragmas(engine, reader_pragmas(mmap_size, cache_size))
+    return engine
+
+
+def get_writer_engine(dbcnstr: str) -> sqlalchemy.engine.base.Engine:
+    """Engine for loading the registry, a SQLite file is switched to WAL mode."""
+    url = sqlalchemy.engine.make_url(dbcnstr)
+    engine = sqlalchemy.create_engine(url, **_engine_args(url))
+    if is_sqlite(url):
+        set_sqlite_pragmas(engine, WRITER_PRAGMAS)
+    return engine
+
+
+def get_async_url(dbcnstr: str) -> sqlalchemy.engine.URL:
+    """Return the connection URL with the async driver for its backend."""
+    url = sqlalchemy.engine.make_url(dbcnstr)
+    if url.drivername in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[url.drivername])
+    return url
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_engine(
+    dbcnstr: str,
+    readonly: bool = False,
+    mmap_size: int = 0,
+    cache_size: int = 0
+) -> sqlalchemy.ext.asyncio.AsyncEngine:
+    """Async equivalent of get_engine."""
+    url = get_async_url(dbcnstr)
+    if readonly:
+        url = readonly_url(url)
+    engine = sqlalchemy.ext.asyncio.create_async_engine(
+        url, **_engine_args(url, sqlalchemy.pool.AsyncAdaptedQueuePool)
+    )
+    if is_sqlite(url):
+        set_sqlite_pragmas(engine.sync_engine, reader_pragmas(mmap_size, cache_size))
+    return engine
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_sessionmaker(
+    dbengine: sqlalchemy.ext.asyncio.AsyncEngine
+) -> sqlalchemy.ext.asyncio.async_sessionmaker:
+    return sqlalchemy.ext.asyncio.async_sessionmaker(bind=dbengine)
+
+
+@functools.lru_cache(maxsize=None)
+def get_sessionmaker(dbengine: sqlalchemy.engine.base.Engine) -> sqlalchemy.orm.sessionmaker:
+    return sqlalchemy.orm.sessionmaker(bind=dbengine)
+
+
+class LazySession:
+    """Proxy for a Session that is only created on first use.
+
+    Requests that never touch the database never check out a connection.
+    """
+
+    __slots__ = ("_factory", "_session")
+
+    def __init__(self, factory: sqlalchemy.orm.sessionmaker):
+        self._factory = factory
+        self._session: typing.Optional[sqlalchemy.orm.Session] = None
+
+    @property
+    def started(self) -> bool:
+        return self._session is not None
+
+    def get_session(self) -> sqlalchemy.orm.Session:
+        if self._session is None:
+            self._session = self._factory()
+        return self._session
+
+    def __getattr__(self, name: str) -> typing.Any:
+        return getattr(self.get_session(), name)
+
+    def dispose(self, rollback: bool = False) -> None:
+        if self._session is None:
+            return
+        try:
+            if rollback:
+                self._session.rollback()
+        finally:
+            self._session.close()
+            self._session = None
+
+
+@contextlib.contextmanager
+def get_dbsession(dbengine) -> typing.Iterator[sqlalchemy.orm.Session]:
+    dbsession = get_sessionmaker(dbengine)()
+    try:
+        yield dbsession
+    except Exception:
+        dbsession.rollback()
+        raise
+    finally:
+        dbsession.close()
+
+
+@contextlib.contextmanager
+def get_lazy_dbsession(dbengine) -> typing.Iterator[LazySession]:
+    dbsession = LazySession(get_sessionmaker(dbengine))
+    try:
+        yield dbsession
+    except Exception:
+        dbsession.dispose(rollback=True)
+        raise
+    finally:
+        dbsession.dispose()
@@ -0,0 +1,33 @@
+"""Reading the import time report of python -X importtime."""
+
+import typing
+
+
+class ImportTime(typing.NamedTuple):
+    module: str
+    self_us: int
+    cumulative_us: int
+    # Nesting level, 0 for modules imported directly by the measured code
+    depth: int
+
+
+def parse_importtime(text: str) -> typing.List[ImportTime]:
+    """Entries of python -X importtime output, in order of import completion."""
+    entries = []
+    for line in text.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        try:
+            self_us = int(parts[0])
+            cumulative_us = int(parts[1])
+        except ValueError:
+            # The column header line
+            continue
+        name = parts[2].rstrip()
+        module = name.lstrip()
+        depth = (len(name) - len(module) - 1) // 2
+        entries.append(ImportTime(module, self_us, cumulative_us, depth))
+    return entries
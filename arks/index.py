@@ -0,0 +1,222 @@
+"""In-process index of the PidDefinition registry.
+
+The registry holds a few thousand NAAN and shoulder definitions and only
+changes when ``load-naans`` runs, so it can be held in memory and used to
+match identifiers to definitions without a database round trip.
+"""
+
+import typing
+
+import sqlalchemy
+import sqlalchemy.orm
+import rslv.lib_rslv.piddefine
+
+
+class IndexEntry(typing.NamedTuple):
+    """The subset of a PidDefinition needed to resolve an identifier."""
+    uniq: str
+    scheme: str
+    prefix: typing.Optional[str]
+    value: typing.Optional[str]
+    target: typing.Optional[str]
+    http_code: typing.Optional[int]
+    synonym_for: typing.Optional[str] = None
+
+
+class _PrefixNode:
+    """Definitions registered under a single scheme and prefix (NAAN)."""
+
+    __slots__ = ("entry", "shoulders", "lengths")
+
+    def __init__(self):
+        # The prefix level definition, i.e. the NAAN without a shoulder
+        self.entry: typing.Optional[IndexEntry] = None
+        # Shoulder definitions keyed by shoulder value
+        self.shoulders: typing.Dict[str, IndexEntry] = {}
+        # Distinct shoulder lengths, longest first
+        self.lengths: typing.Tuple[int, ...] = ()
+
+
+class PrefixIndex:
+    """Longest match lookup of scheme / prefix / shoulder definitions.
+
+    Lookup mirrors the database match: the longest shoulder that starts the
+    identifier value, then the prefix level definition, then the scheme level
+    definition. Each prefix keeps its distinct shoulder lengths so a lookup
+    costs one dict probe per distinct length rather than a scan of shoulders.
+    """
+
+    def __init__(self, entries: typing.Iterable[IndexEntry]):
+        # {scheme: [scheme_entry, {prefix: _PrefixNode}]}
+        self._schemes: typing.Dict[str, list] = {}
+        self._size = 0
+        for entry in entries:
+            self._add(entry)
+        for _, prefixes in self._schemes.values():
+            for node in prefixes.values():
+                node.lengths = tuple(sorted({len(k) for k in node.shoulders}, reverse=True))
+
+    def _add(self, entry: IndexEntry) -> None:
+        scheme_node = self._schemes.setdefault(entry.scheme, [None, {}])
+        self._size += 1
+        if not entry.prefix:
+            scheme_node[0] = entry
+            return
+        node = scheme_node[1].get(entry.prefix)
+        if node is None:
+            node = _PrefixNode()
+            scheme_node[1][entry.prefix] = node
+        if entry.value:
+            node.shoulders[entry.value] = entry
+        else:
+            node.entry = entry
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> typing.Iterator[IndexEntry]:
+        for scheme_entry, prefixes in self._schemes.values():
+            if scheme_entry is not None:
+                yield scheme_entry
+            for node in prefixes.values():
+                if node.entry is not None:
+                    yield node.entry
+                yield from node.shoulders.values()
+
+    def has_prefix(self, scheme: str, prefix: str) -> bool:
+        scheme_node = self._schemes.get(scheme)
+        if scheme_node is None:
+            return False
+        return prefix in scheme_node[1]
+
+    def lookup(
+        self,
+        scheme: typing.Optional[str],
+        prefix: typing.Optional[str],
+        value: typing.Optional[str]
+    ) -> typing.Optional[IndexEntry]:
+        """Return the most specific definition matching the identifier parts."""
+        scheme_node = self._schemes.get(scheme)
+        if scheme_node is None:
+            return None
+        if prefix:
+            node = scheme_node[1].get(prefix)
+            if node is not None:
+                if value and node.lengths:
+                    n = len(value)
+                    for length in node.lengths:
+                        if length <= n:
+                            entry = node.shoulders.get(value[:length])
+                            if entry is not None:
+                                return entry
+                if node.entry is not None:
+                    return node.entry
+        return scheme_node[0]
+
+
+class PrefixSet:
+    """Registered schemes and the prefixes (NAANs) registered under each.
+
+    Used to turn away identifiers with an unregistered NAAN before any
+    database or template work.
+    """
+
+    def __init__(self, pairs: typing.Iterable[typing.Tuple[str, typing.Optional[str]]]):
+        self._schemes: typing.Dict[str, typing.Set[str]] = {}
+        for scheme, prefix in pairs:
+            prefixes = self._schemes.setdefault(scheme, set())
+            if prefix:
+                prefixes.add(prefix)
+
+    def __len__(self) -> int:
+        return sum(len(prefixes) for prefixes in self._schemes.values())
+
+    def is_unregistered(self, scheme: typing.Optional[str], prefix: typing.Optional[str]) -> bool:
+        """True if scheme is registered but prefix is not registered under it."""
+        if not prefix:
+            return False
+        prefixes = self._schemes.get(scheme)
+        return prefixes is not None and prefix not in prefixes
+
+
+def _select_entries() -> sqlalchemy.Select:
+    PD = rslv.lib_rslv.piddefine.PidDefinition
+    return sqlalchemy.select(
+        PD.uniq,
+        PD.scheme,
+        PD.prefix,
+        PD.value,
+        PD.target,
+        PD.http_code,
+        PD.synonym_for,
+    )
+
+
+def load_entries(dbsession: sqlalchemy.orm.Session) -> typing.Iterator[IndexEntry]:
+    """Yield an IndexEntry for each PidDefinition in the registry."""
+    for row in dbsession.execute(_select_entries()):
+        yield IndexEntry(*row)
+
+
+def build_index(dbsession: sqlalchemy.orm.Session) -> PrefixIndex:
+    return PrefixIndex(load_entries(dbsession))
+
+
+def load_prefix_set(dbsession: sqlalchemy.orm.Session) -> PrefixSet:
+    PD = rslv.lib_rslv.piddefine.PidDefinition
+    return PrefixSet(dbsession.execute(sqlalchemy.select(PD.scheme, PD.prefix).distinct()))
+
+
+def lookup_entry(
+    dbsession: sqlalchemy.orm.Session,
+    scheme: typing.Optional[str],
+    prefix: typing.Optional[str],
+    value: typing.Optional[str]
+) -> typing.Optional[IndexEntry]:
+    """Database equivalent of PrefixIndex.lookup, a single query.
+
+    Usable with AsyncSession.run_sync to match on the async engine.
+    """
+    PD = rslv.lib_rslv.piddefine.PidDefinition
+    value_length = sqlalchemy.func.length(PD.value)
+    no_value = sqlalchemy.or_(PD.value.is_(None), PD.value == "")
+    matches = [sqlalchemy.and_(PD.prefix.is_(None), no_value)]
+    if prefix:
+        prefix_matches = [no_value]
+        if value:
+            # The shoulder is a leading substring of value
+            prefix_matches.append(
+                sqlalchemy.func.substr(sqlalchemy.literal(value), 1, value_length) == PD.value
+            )
+        matches.append(sqlalchemy.and_(PD.prefix == prefix, sqlalchemy.or_(*prefix_matches)))
+    stmt = (
+        _select_entries()
+        .where(PD.scheme == scheme, sqlalchemy.or_(*matches))
+        # Prefix matches before the scheme match, longest shoulder first
+        .order_by(PD.prefix.is_(None), sqlalchemy.func.coalesce(value_length, 0).desc())
+        .limit(1)
+    )
+    row = dbsession.execute(stmt).first()
+    if row is None:
+        return None
+    return IndexEntry(*row)
+
+
+def scheme_counts(dbsession: sqlalchemy.orm.Session) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+    """{scheme: {"prefix_count": n, "valid": bool}} from a single GROUP BY query.
+
+    prefix_count counts distinct prefixes, the scheme level definition with
+    no prefix included, and valid is True if any definition of the scheme
+    has a target.
+    """
+    PD = rslv.lib_rslv.piddefine.PidDefinition
+    stmt = sqlalchemy.select(
+        PD.scheme,
+        sqlalchemy.func.count(sqlalchemy.distinct(PD.prefix)),
+        sqlalchemy.func.max(sqlalchemy.case((PD.prefix.is_(None), 1), else_=0)),
+        sqlalchemy.func.max(sqlalchemy.case((PD.target.is_not(None), 1), else_=0)),
+    ).group_by(PD.scheme)
+    return {
+        scheme: {"prefix_count": n_prefixes + (has_null or 0), "valid": bool(has_target)}
+        for scheme, n_prefixes, has_null, has_target in dbsession.execute(stmt)
+    }
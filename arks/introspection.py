@@ -0,0 +1,157 @@
+"""Cached introspection responses.
+
+Introspection documents (``/.info/...`` and ``?info``) only change when the
+registry does, so the responses rendered by the rslv router are kept with
+their headers, an ETag and pre-compressed variants, and served without a
+database session until the registry is updated.
+"""
+
+import gzip
+import hashlib
+import typing
+
+from arks.cache import MISSING, buffered_send
+from arks.resolve import INFO_PATH, identifier_from_path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Query strings of ?info and ?? introspection requests
+INFO_QUERIES = (b"info", b"?")
+# Bodies smaller than this are not worth compressing
+COMPRESS_MIN_SIZE = 512
+# Larger bodies are not cached
+MAX_BODY_SIZE = 1024 * 1024
+# Router headers replaced when a cached document is served
+_REPLACED_HEADERS = (b"content-length", b"content-encoding", b"etag", b"vary")
+
+
+class InfoDocument(typing.NamedTuple):
+    body: bytes
+    # Response headers set by the router less _REPLACED_HEADERS, with
+    # Accept-Encoding added to Vary
+    headers: typing.Tuple[typing.Tuple[bytes, bytes], ...]
+    etag: str
+    # {content-coding: body} of pre-compressed variants
+    encoded: typing.Dict[str, bytes]
+
+
+def cache_key(method: str, path: str, query_string: bytes) -> typing.Optional[str]:
+    """Key of an introspection request whose 200 response may be cached, else None."""
+    if method != "GET":
+        return None
+    if path.startswith(INFO_PATH):
+        if len(path) == len(INFO_PATH):
+            return None
+    elif query_string not in INFO_QUERIES or identifier_from_path(path) is None:
+        return None
+    if query_string:
+        return f"{path}?{query_string.decode('latin-1')}"
+    return path
+
+
+def make_document(
+    body: bytes, headers: typing.Iterable[typing.Tuple[bytes, bytes]]
+) -> InfoDocument:
+    digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+    encoded = {}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        if brotli is not None:
+            encoded["br"] = brotli.compress(body)
+        encoded["gzip"] = gzip.compress(body, compresslevel=6, mtime=0)
+    headers = list(headers)
+    vary = [v for k, v in headers if k.lower() == b"vary"]
+    kept = [(k, v) for k, v in headers if k.lower() not in _REPLACED_HEADERS]
+    kept.append((b"vary", b", ".join(vary + [b"Accept-Encoding"])))
+    return InfoDocument(body, tuple(kept), f'"{digest}"', encoded)
+
+
+def accepted_encoding(accept_encoding: str, available: typing.Iterable[str]) -> typing.Optional[str]:
+    """The first of available accepted by an Accept-Encoding header value."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        params = params.replace(" ", "")
+        if params in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(coding.strip().lower())
+    for coding in available:
+        if coding in accepted or "*" in accepted:
+            return coding
+    return None
+
+
+def request_header(scope: typing.Dict[str, typing.Any], name: bytes) -> str:
+    for key, value in scope["headers"]:
+        if key == name:
+            return value.decode("latin-1")
+    return ""
+
+
+async def send_document(
+    doc: InfoDocument, scope: typing.Dict[str, typing.Any], send: typing.Callable
+) -> None:
+    """Send doc, or 304 if the client copy is current."""
+    headers = [(b"etag", doc.etag.encode("latin-1"))]
+    if request_header(scope, b"if-none-match") == doc.etag:
+        headers.extend((k, v) for k, v in doc.headers if k == b"vary")
+        await send({"type": "http.response.start", "status": 304, "headers": headers})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    body = doc.body
+    coding = accepted_encoding(request_header(scope, b"accept-encoding"), doc.encoded)
+    if coding is not None:
+        body = doc.encoded[coding]
+        headers.append((b"content-encoding", coding.encode("latin-1")))
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": 200, "headers": list(doc.headers) + headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class InfoCacheMiddleware:
+    """ASGI middleware serving introspection responses from app.state.info_cache.
+
+    Added after the resolve middleware so that cached documents are sent
+    before a session is set up. Only 200 responses without cookies are
+    cached, until the registry is updated or the cache TTL passes. Other
+    requests are passed through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        key = cache_key(scope["method"], scope["path"], scope.get("query_string", b""))
+        if key is None:
+            return await self.app(scope, receive, send)
+        state = scope["app"].state
+        doc = state.info_cache.get(key, state.registry_updated)
+        if doc is not MISSING:
+            return await send_document(doc, scope, send)
+        generation = state.registry_updated
+
+        def _keep(start):
+            cookies = any(k.lower() == b"set-cookie" for k, _ in start.get("headers", []))
+            return start["status"] == 200 and not cookies
+
+        async def _complete(start, body):
+            doc = make_document(body, start.get("headers", []))
+            state.info_cache.set(key, doc, generation)
+            await send_document(doc, scope, send)
+
+        await self.app(scope, receive, buffered_send(send, _keep, MAX_BODY_SIZE, _complete))
+
+
+def prewarm_paths(entries: typing.Iterable[typing.Any]) -> typing.Iterator[str]:
+    """Introspection paths of each NAAN and shoulder definition."""
+    for entry in entries:
+        if not entry.prefix:
+            continue
+        if entry.value:
+            yield f"{INFO_PATH}{entry.scheme}:/{entry.prefix}/{entry.value}"
+        else:
+            yield f"{INFO_PATH}{entry.scheme}:/{entry.prefix}"
@@ -0,0 +1,297 @@
+"""Loading NAAN records into the resolver registry."""
+
+import datetime
+import itertools
+import logging
+import typing
+
+import sqlalchemy
+import sqlalchemy.orm
+
+import rslv.lib_rslv.piddefine
+import arks.db
+import arks.naans
+from arks import APP_NAME
+
+
+def get_logger():
+    return logging.getLogger(APP_NAME)
+
+
+# These are all arks
+ARK_SCHEME = "ark"
+# Template pattern for a canonical ark representation
+# TODO: deal with the slash
+ARK_CANONICAL = "ark:/${prefix}/${value}"
+# NAAN record types that are loaded as definitions
+RECORD_TYPE_NAMES = [
+    "PublicNAAN",
+    "PublicNAANShoulder",
+]
+# PidDefinition attributes compared when bulk loading
+DEFINITION_FIELDS = (
+    "scheme",
+    "prefix",
+    "value",
+    "target",
+    "http_code",
+    "canonical",
+    "properties",
+    "synonym_for",
+)
+
+
+def scheme_definition() -> rslv.lib_rslv.piddefine.PidDefinition:
+    """The base ark: scheme definition."""
+    return rslv.lib_rslv.piddefine.PidDefinition(
+        scheme=ARK_SCHEME,
+        target="/.info/${pid}",
+        canonical=ARK_CANONICAL,
+        synonym_for=None,
+        properties={
+            "what": "ark",
+            "name": "Archival Resource Key",
+        },
+    )
+
+
+def record_to_definition(
+    record: typing.Dict[str, typing.Any]
+) -> typing.Optional[rslv.lib_rslv.piddefine.PidDefinition]:
+    """Create the PidDefinition for a NAAN or shoulder record, None if not loadable."""
+    L = get_logger()
+    if record.get("rtype") not in RECORD_TYPE_NAMES:
+        return None
+    _prefix = record.get("what")
+    _value = None
+    if record['rtype'] == 'PublicNAANShoulder':
+        _prefix = record.get("naan", None)
+        _value = record.get("shoulder", None)
+    if _value is None and _prefix is None:
+        L.warning("Entry %s is has null prefix and value.", record["what"])
+        return None
+    _target = record.get("target", {}).get("url")
+    if _target is None:
+        _target = f"/.info/{ARK_SCHEME}/{_prefix}"
+    _properties = record
+    _http_code = record.get("target", {}).get("http_code", 302)
+    _properties["target"] = {"DEFAULT": record.get("target")}
+    return rslv.lib_rslv.piddefine.PidDefinition(
+        scheme=ARK_SCHEME,
+        prefix=_prefix,
+        value=_value,
+        target=_target,
+        http_code = _http_code,
+        canonical=ARK_CANONICAL,
+        synonym_for=None,
+        properties=_properties,
+    )
+
+
+def bulk_add_or_update(
+    session: sqlalchemy.orm.Session,
+    entries: typing.Iterable[rslv.lib_rslv.piddefine.PidDefinition]
+) -> typing.Tuple[int, int]:
+    """Diff entries against the existing definitions within the session transaction.
+
+    Existing rows are read in a single query keyed on uniq. New entries are
+    added and changed attributes copied onto existing rows. The caller's
+    commit flushes the INSERTs and UPDATEs as batched executemany statements.
+
+    Returns (added, updated).
+    """
+    L = get_logger()
+    PD = rslv.lib_rslv.piddefine.PidDefinition
+    _added = 0
+    _updated = 0
+    try:
+        existing = {pd.uniq: pd for pd in session.scalars(sqlalchemy.select(PD))}
+        for entry in entries:
+            current = existing.get(entry.uniq)
+            if current is None:
+                session.add(entry)
+                existing[entry.uniq] = entry
+                _added += 1
+                L.debug("Added %s", entry.uniq)
+                continue
+            n_changes = 0
+            for field in DEFINITION_FIELDS:
+                # Attributes left unset on the new entry keep their stored value
+                if field not in entry.__dict__:
+                    continue
+                value = getattr(entry, field)
+                if getattr(current, field) != value:
+                    setattr(current, field, value)
+                    n_changes += 1
+            if n_changes > 0:
+                _updated += 1
+                L.debug("Updated %s with %s changes", entry.uniq, n_changes)
+    except Exception:
+        session.rollback()
+        raise
+    return (_added, _updated)
+
+
+def records_to_db(
+    records: typing.Dict[str, typing.Any],
+    db_str: str,
+    clear_existing: bool = False,
+    bulk: bool = False,
+    source_state: typing.Optional[typing.Dict[str, typing.Optional[str]]] = None
+) -> typing.Tuple[int, int, int, int, int]:
+    """Mapping from an ARK NAAN record (naan) to a resolver PidDefinition (pd)
+
+    pd.scheme = "ark"
+    pd.prefix = naan.what
+    pd.value = None
+    pd.splitter = None
+    pd.pid_model =
+    pd.target = naan.target.url
+    pd.http_code = naan.target.http_code
+    pd.canonical = "ark:/${prefix}/${value}
+    pd.properties = naan
+    pd.synonym_for = None
+
+    Shoulder records map the same, except:
+    pd.prefix = naan.what before "/"
+    pd.value = naan.what after "/"
+
+    A digest of each loaded record is kept in the registry so only records
+    that changed since the last load are converted and written, and
+    definitions of records no longer present are removed.
+
+    With bulk, changed records are diffed against the registry and written
+    in a single transaction instead of one add_or_update per record.
+
+    source_state, the validators of the fetched records document, is saved
+    with the final commit of the load.
+
+    Returns (total, added, updated, synonyms, removed).
+    """
+
+    L = get_logger()
+    engine = arks.db.get_writer_engine(db_str)
+    rslv.lib_rslv.piddefine.create_database(engine, description="ark prefixes and shoulders")
+    arks.naans.create_digest_table(engine)
+    session = rslv.lib_rslv.piddefine.get_session(engine)
+    repository = rslv.lib_rslv.piddefine.PidDefinitionCatalog(session)
+    # check to see if the list of records is more recent than the repository
+    meta = repository.get_metadata()
+    records_modified_date = datetime.datetime.fromisoformat(records["metadata"]["date_modified"])
+    _total = 0
+    _added = 0
+    _updated = 0
+    _nsynonyms = 0
+    _removed = 0
+    if meta["updated"] is not None:
+        if meta["updated"] > records_modified_date:
+            L.info("Registry is concurrent with naan records")
+            if source_state is not None:
+                arks.naans.save_source_state(session, source_state, datetime.datetime.now())
+                session.commit()
+            return (_total, _added, _updated, _nsynonyms, _removed)
+
+    digests = arks.naans.load_digests(session)
+    # {what: (uniq, digest)} of changed records written in this load
+    _changed = {}
+    # what of loadable records present in this load
+    _seen = set()
+    # uniq of the definitions of all loadable records in this load
+    _produced = set()
+
+    def _changed_entries():
+        """Yield (what, digest, entry) of records that changed since the last load."""
+        nonlocal _total
+        for record in records["data"]:
+            _total += 1
+            what = record.get("what")
+            # Digest before record_to_definition modifies the record
+            digest = arks.naans.record_digest(record)
+            current = digests.get(what)
+            if current is not None and current[1] == digest:
+                _seen.add(what)
+                _produced.add(current[0])
+                continue
+            entry = record_to_definition(record)
+            if entry is None:
+                continue
+            _seen.add(what)
+            # Also when the write fails, so the stored definition is kept
+            _produced.add(entry.uniq)
+            yield what, digest, entry
+
+    def _save_digests():
+        nonlocal _removed
+        # Definitions no record of this load produced, including the previous
+        # uniq of a record whose uniq changed
+        removed_uniqs = sorted({uniq for uniq, _ in digests.values()} - _produced)
+        if removed_uniqs:
+            PD_table = rslv.lib_rslv.piddefine.PidDefinition.__table__
+            session.execute(
+                PD_table.delete().where(PD_table.c.uniq == sqlalchemy.bindparam("b_uniq")),
+                [{"b_uniq": uniq} for uniq in removed_uniqs],
+            )
+            _removed = len(removed_uniqs)
+            L.debug("Removed %s", removed_uniqs)
+        removed = [what for what in digests if what not in _seen]
+        now = datetime.datetime.now()
+        arks.naans.save_digests(session, _changed, removed, now)
+        if source_state is not None:
+            arks.naans.save_source_state(session, source_state, now)
+
+    if bulk:
+        def _bulk_entries():
+            # Written in one transaction, so all digests are saved or none
+            for what, digest, entry in _changed_entries():
+                _changed[what] = (entry.uniq, digest)
+                yield entry
+
+        _added, _updated = bulk_add_or_update(
+            session, itertools.chain([scheme_definition()], _bulk_entries())
+        )
+        try:
+            _save_digests()
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        repository.refresh_metadata()
+        return (_total, _added, _updated, _nsynonyms, _removed)
+
+    try:
+        # Add a base ark: scheme definition.
+        entry = scheme_definition()
+        res = repository.add_or_update(entry)
+        if res["n_changes"] < 0:
+            L.info("Added entry %s", res["uniq"])
+        elif res["n_changes"] > 0:
+            L.info("Updated entry %s with %s changes", res["uniq"], res["n_changes"])
+        else:
+            L.info("Existing entry %s no changes.", res["uniq"])
+    except Exception as e:
+        L.warning(e)
+        pass
+
+    for what, digest, entry in _changed_entries():
+        try:
+            res = repository.add_or_update(entry)
+            # Only after the write, so a failed record is retried next load
+            _changed[what] = (entry.uniq, digest)
+            uniq = res.get("uniq", entry.uniq)
+            n_changes = res.get("n_changes", -1)
+            if n_changes < 0:
+                _added += 1
+                L.debug("Added %s", uniq)
+            elif n_changes == 0:
+                L.debug("No changes for %s", uniq)
+            else:
+                _updated += 1
+                L.debug("Updated %s with %s changes", uniq, n_changes)
+        except sqlalchemy.exc.IntegrityError as e:
+            repository._session.rollback()
+            L.exception(e)
+            L.error("Failed to add key for %s", entry.uniq)
+    _save_digests()
+    session.commit()
+    repository.refresh_metadata()
+    return (_total, _added, _updated, _nsynonyms, _removed)
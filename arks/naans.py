@@ -0,0 +1,303 @@
+"""Streaming retrieval of the NAAN records document.
+
+The NAAN registry document is a JSON object with a ``metadata`` object and a
+``data`` array of records. The reader here parses it incrementally so that
+records are produced one at a time instead of holding the whole document in
+memory, and the HTTP fetch is conditional on the ETag / Last-Modified of the
+previous successful load. A digest of each loaded record and the validators
+of the source are kept in the registry database so unchanged records can be
+skipped on reload.
+"""
+
+import datetime
+import functools
+import hashlib
+import json
+import logging
+import typing
+
+import sqlalchemy
+import sqlalchemy.orm
+
+from arks import APP_NAME
+
+if typing.TYPE_CHECKING:
+    import httpx
+
+# Characters read per chunk from local files
+CHUNK_SIZE = 65536
+_WHITESPACE = " \t\n\r"
+
+_metadata = sqlalchemy.MetaData()
+
+# Digest of each loaded NAAN record keyed by the record "what", kept in the
+# registry database alongside the definition created from the record.
+record_digests = sqlalchemy.Table(
+    "arks_record_digest",
+    _metadata,
+    sqlalchemy.Column("what", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("uniq", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("digest", sqlalchemy.String, nullable=False),
+    sqlalchemy.Column("updated", sqlalchemy.DateTime, nullable=False),
+)
+
+# ETag and Last-Modified of the NAAN records document last loaded from each
+# source URL, saved in the transaction of the load so they always describe
+# the registry they are stored in.
+source_states = sqlalchemy.Table(
+    "arks_source_state",
+    _metadata,
+    sqlalchemy.Column("source", sqlalchemy.String, primary_key=True),
+    sqlalchemy.Column("etag", sqlalchemy.String, nullable=True),
+    sqlalchemy.Column("last_modified", sqlalchemy.String, nullable=True),
+    sqlalchemy.Column("updated", sqlalchemy.DateTime, nullable=False),
+)
+
+
+def get_logger():
+    return logging.getLogger(APP_NAME)
+
+
+class JSONStreamReader:
+    """Incremental reader of JSON values from an iterable of text chunks."""
+
+    def __init__(self, chunks: typing.Iterable[str]):
+        self._chunks = iter(chunks)
+        self._decoder = json.JSONDecoder()
+        self._buf = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """Append the next chunk to the buffer, False if there are no more."""
+        if self._eof:
+            return False
+        chunk = next(self._chunks, None)
+        if chunk is None:
+            self._eof = True
+            return False
+        self._buf = self._buf[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character, "" at the end of input."""
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char: str) -> None:
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected '{char}' but found '{found}' in JSON stream")
+        self._pos += 1
+
+    def decode(self) -> typing.Any:
+        """Decode the next complete JSON value."""
+        while True:
+            self.peek()
+            try:
+                value, end = self._decoder.raw_decode(self._buf, self._pos)
+                # A value ending at the buffer end may be a truncated number.
+                if end < len(self._buf) or self._eof:
+                    self._pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+            self._fill()
+
+    def iter_array(self) -> typing.Iterator[typing.Any]:
+        """Yield the items of the array at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.decode()
+            found = self.peek()
+            self._pos += 1
+            if found == "]":
+                return
+            if found != ",":
+                raise ValueError(f"Expected ',' or ']' but found '{found}' in JSON stream")
+
+    def iter_members(self) -> typing.Iterator[str]:
+        """Yield the keys of the object at the current position.
+
+        After each key the caller must consume the member value with decode()
+        or iter_array() before advancing the iterator.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self._pos += 1
+            return
+        while True:
+            key = self.decode()
+            self.expect(":")
+            yield key
+            found = self.peek()
+            self._pos += 1
+            if found == "}":
+                return
+            if found != ",":
+                raise ValueError(f"Expected ',' or '}}' but found '{found}' in JSON stream")
+
+
+def read_naan_records(chunks: typing.Iterable[str]) -> typing.Dict[str, typing.Any]:
+    """Parse a NAAN records document, with "data" as a lazy iterator of records.
+
+    Records are streamed when "metadata" precedes "data" in the document,
+    which is the case for the published registry. Otherwise the records
+    have to be held until the metadata has been read.
+    """
+    reader = JSONStreamReader(chunks)
+    doc: typing.Dict[str, typing.Any] = {}
+    members = reader.iter_members()
+    for key in members:
+        if key != "data":
+            doc[key] = reader.decode()
+        elif "metadata" in doc:
+            doc["data"] = _iter_data(reader, members, doc)
+            return doc
+        else:
+            doc["data"] = iter(list(reader.iter_array()))
+    return doc
+
+
+def _iter_data(
+    reader: JSONStreamReader,
+    members: typing.Iterator[str],
+    doc: typing.Dict[str, typing.Any]
+) -> typing.Iterator[typing.Any]:
+    yield from reader.iter_array()
+    # Pick up any members following the records
+    for key in members:
+        doc[key] = reader.decode()
+
+
+def iter_file_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> typing.Iterator[str]:
+    with open(path, "r") as f:
+        yield from iter(functools.partial(f.read, chunk_size), "")
+
+
+def read_source_state(engine: sqlalchemy.engine.Engine, source: str) -> typing.Dict[str, str]:
+    """Return the validators saved in the registry for source, empty if none are recorded."""
+    with engine.connect() as connection:
+        if not sqlalchemy.inspect(connection).has_table(source_states.name):
+            return {}
+        row = connection.execute(
+            sqlalchemy.select(source_states.c.etag, source_states.c.last_modified)
+            .where(source_states.c.source == source)
+        ).first()
+    if row is None:
+        return {}
+    state = {}
+    if row.etag is not None:
+        state["etag"] = row.etag
+    if row.last_modified is not None:
+        state["last_modified"] = row.last_modified
+    return state
+
+
+def source_state(source: str, headers: typing.Mapping[str, str]) -> typing.Dict[str, typing.Optional[str]]:
+    """The validators of a response from source, for save_source_state."""
+    return {
+        "source": source,
+        "etag": headers.get("etag"),
+        "last_modified": headers.get("last-modified"),
+    }
+
+
+def save_source_state(
+    session: sqlalchemy.orm.Session,
+    state: typing.Dict[str, typing.Optional[str]],
+    updated: datetime.datetime
+) -> None:
+    """Replace the validators of state["source"].
+
+    Statements are issued on session and committed by the caller.
+    """
+    session.execute(source_states.delete().where(source_states.c.source == state["source"]))
+    session.execute(source_states.insert(), [dict(state, updated=updated)])
+
+
+def conditional_headers(state: typing.Dict[str, str]) -> typing.Dict[str, str]:
+    headers = {}
+    if "etag" in state:
+        headers["If-None-Match"] = state["etag"]
+    if "last_modified" in state:
+        headers["If-Modified-Since"] = state["last_modified"]
+    return headers
+
+
+def load_source(
+    client: "httpx.Client",
+    source: str,
+    engine: sqlalchemy.engine.Engine,
+    load: typing.Callable[[typing.Dict[str, typing.Any], typing.Dict[str, typing.Optional[str]]], typing.Any],
+    force: bool = False
+) -> typing.Any:
+    """Stream the NAAN records document at the source URL into load.
+
+    The request carries the validators saved in the registry at engine by
+    the previous load, unless force. Returns None without calling load if
+    the source answers 304, else the result of load(records, state). load
+    is expected to save state with save_source_state when it commits.
+    """
+    L = get_logger()
+    state = {} if force else read_source_state(engine, source)
+    with client.stream("GET", source, headers=conditional_headers(state)) as response:
+        if response.status_code == 304:
+            L.info("NAAN records at %s not modified since last load", source)
+            return None
+        response.raise_for_status()
+        return load(read_naan_records(response.iter_text()), source_state(source, response.headers))
+
+
+def create_digest_table(engine: sqlalchemy.engine.Engine) -> None:
+    _metadata.create_all(engine)
+
+
+def record_digest(record: typing.Dict[str, typing.Any]) -> str:
+    """Digest of the canonical JSON serialization of a NAAN record."""
+    canonical = json.dumps(record, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def load_digests(session: sqlalchemy.orm.Session) -> typing.Dict[str, typing.Tuple[str, str]]:
+    """Return {what: (uniq, digest)} for all loaded records."""
+    rows = session.execute(
+        sqlalchemy.select(record_digests.c.what, record_digests.c.uniq, record_digests.c.digest)
+    )
+    return {what: (uniq, digest) for what, uniq, digest in rows}
+
+
+def save_digests(
+    session: sqlalchemy.orm.Session,
+    changed: typing.Dict[str, typing.Tuple[str, str]],
+    removed: typing.Iterable[str],
+    updated: datetime.datetime
+) -> None:
+    """Replace the digests of changed records and drop those of removed records.
+
+    Statements are issued on session and committed by the caller.
+    """
+    keys = [{"b_what": what} for what in list(changed.keys()) + list(removed)]
+    if keys:
+        session.execute(
+            record_digests.delete().where(record_digests.c.what == sqlalchemy.bindparam("b_what")),
+            keys,
+        )
+    if changed:
+        session.execute(
+            record_digests.insert(),
+            [
+                {"what": what, "uniq": uniq, "digest": digest, "updated": updated}
+                for what, (uniq, digest) in changed.items()
+            ],
+        )
@@ -0,0 +1,83 @@
+"""Early not found answers for identifier requests.
+
+Scanners and broken links request many identifiers that do not resolve.
+Identifiers whose NAAN is not registered can be turned away before any
+database or template work, and the 404 responses to other identifiers are
+kept until the registry is updated.
+"""
+
+import json
+import typing
+
+from arks.cache import MISSING, buffered_send
+from arks.resolve import INFO_PATH, identifier_from_path
+
+# Larger 404 bodies are not cached
+MAX_BODY_SIZE = 64 * 1024
+REJECT_BODY = json.dumps({"detail": "Not Found"}, separators=(",", ":")).encode("utf-8")
+REJECT_HEADERS = [
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(REJECT_BODY)).encode("latin-1")),
+]
+
+
+async def send_not_found(
+    send: typing.Callable,
+    headers: typing.List[typing.Tuple[bytes, bytes]],
+    body: bytes
+) -> None:
+    await send({"type": "http.response.start", "status": 404, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+class NotFoundMiddleware:
+    """ASGI middleware answering unregistered NAANs and cached misses.
+
+    Added after the other request path middleware so that it runs before
+    them, without a session or a resolve. With app.state.known_prefixes set,
+    resolve requests for an identifier with an unregistered NAAN are
+    answered 404. 404 responses to GET requests are kept in
+    app.state.negative_cache until the registry is updated and also answer
+    HEAD requests. Other requests are passed through untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        path = scope["path"]
+        identifier = identifier_from_path(path)
+        if identifier is None:
+            return await self.app(scope, receive, send)
+        state = scope["app"].state
+        key = f"{path}?{scope.get('query_string', b'').decode('latin-1')}"
+        cached = state.negative_cache.get(key, state.registry_updated)
+        if cached is not MISSING:
+            headers, body = cached
+            if scope["method"] == "HEAD":
+                body = b""
+            return await send_not_found(send, list(headers), body)
+        known = state.known_prefixes
+        if known is not None and not path.startswith(INFO_PATH):
+            try:
+                pid_parts = state.identifier_splitter.split(identifier)
+            except Exception:
+                pid_parts = {}
+            if known.is_unregistered(pid_parts.get("scheme"), pid_parts.get("prefix")):
+                state.unknown_naan_rejects += 1
+                return await send_not_found(send, REJECT_HEADERS, REJECT_BODY)
+        if scope["method"] != "GET" or state.negative_cache.maxsize <= 0:
+            return await self.app(scope, receive, send)
+        generation = state.registry_updated
+
+        def _keep(start):
+            return start["status"] == 404
+
+        async def _complete(start, body):
+            headers = tuple(start.get("headers", []))
+            state.negative_cache.set(key, (headers, body), generation)
+            await send_not_found(send, list(headers), body)
+
+        await self.app(scope, receive, buffered_send(send, _keep, MAX_BODY_SIZE, _complete))
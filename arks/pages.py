@@ -0,0 +1,72 @@
+"""Pre-rendered human readable pages.
+
+The templated pages only vary by environment and version, which are fixed
+for the life of the process, so each template is rendered once and served as
+bytes with an ETag. Pages showing the request path are rendered with
+REQUEST_PATH in its place, substituted for each response.
+"""
+
+import hashlib
+import html
+import logging
+import typing
+
+import fastapi
+
+from arks import APP_NAME
+
+if typing.TYPE_CHECKING:
+    import jinja2
+
+NOT_FOUND_PAGE = "404.html"
+# Rendered as request.path, contains no characters escaped by the templates
+REQUEST_PATH = "ARKS-REQUEST-PATH"
+
+
+def get_logger():
+    return logging.getLogger(APP_NAME)
+
+
+class RenderedPage(typing.NamedTuple):
+    body: bytes
+    etag: str
+    # True if body contains REQUEST_PATH
+    per_request: bool = False
+
+
+def render_pages(
+    env: "jinja2.Environment", context: typing.Dict[str, typing.Any]
+) -> typing.Dict[str, RenderedPage]:
+    """Render every template in env with context, keyed by template name."""
+    L = get_logger()
+    context = dict(context, request={"path": REQUEST_PATH})
+    marker = REQUEST_PATH.encode("utf-8")
+    pages = {}
+    for name in env.list_templates():
+        try:
+            body = env.get_template(name).render(context).encode("utf-8")
+        except Exception as e:
+            L.warning("Unable to render page %s: %s", name, e)
+            continue
+        digest = hashlib.blake2b(body, digest_size=8).hexdigest()
+        pages[name] = RenderedPage(body, f'"{digest}"', marker in body)
+    return pages
+
+
+def page_response(
+    page: RenderedPage, request: fastapi.Request, status_code: int = 200
+) -> fastapi.Response:
+    """Response for a rendered page, 304 if the client copy is current."""
+    if page.per_request:
+        path = html.escape(request.scope["path"]).encode("utf-8")
+        return fastapi.Response(
+            content=page.body.replace(REQUEST_PATH.encode("utf-8"), path),
+            status_code=status_code,
+            media_type="text/html",
+        )
+    headers = {"ETag": page.etag}
+    if status_code == 200 and request.headers.get("if-none-match") == page.etag:
+        return fastapi.Response(status_code=304, headers=headers)
+    return fastapi.Response(
+        content=page.body, status_code=status_code, media_type="text/html", headers=headers
+    )
@@ -0,0 +1,132 @@
+"""Pre-forking multi-worker server for production.
+
+The parent process imports the app and builds the resolver index once,
+then forks uvicorn workers that accept on a shared listening socket. The
+index and imported modules are shared copy-on-write with the workers, so
+worker startup does not repeat the registry load and adding workers does
+not multiply the load time.
+
+The parent restarts workers that exit and forwards SIGTERM and SIGINT to
+them on shutdown.
+"""
+
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+import typing
+
+from arks import APP_NAME
+
+# Minimum seconds between starting a worker and restarting it, to avoid a
+# tight loop when workers fail at startup.
+RESTART_DELAY = 1.0
+
+
+def get_logger():
+    return logging.getLogger(APP_NAME)
+
+
+def bind_socket(host: str, port: int, backlog: int = 2048) -> socket.socket:
+    """Listening socket shared by all workers."""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def preload() -> None:
+    """Import the app and load the registry snapshot for the workers to share."""
+    import arks.app
+    from arks.db import get_engine
+
+    L = get_logger()
+    app = arks.app.app
+    settings = app.state.settings
+    t0 = time.perf_counter()
+    engine = get_engine(settings.db_connection_string, **arks.app.engine_options(settings))
+    try:
+        app.state.registry_updated = arks.app.get_registry_updated(engine)
+    except Exception as e:
+        L.error("Unable to read registry metadata: %s", e)
+    # A snapshot file is mapped by each worker, sharing the page cache instead
+    if settings.resolver_index and not settings.snapshot_path:
+        app.state.preloaded_index = arks.app.load_resolver_index(engine)
+    # Pooled connections must not be shared with the forked workers
+    engine.dispose()
+    # Keep the collector from touching, and so copying, the shared objects
+    gc.collect()
+    gc.freeze()
+    L.info("Preloaded registry snapshot in %.3f s", time.perf_counter() - t0)
+
+
+def run_worker(sock: socket.socket) -> None:
+    import uvicorn
+
+    import arks.app
+
+    settings = arks.app.app.state.settings
+    config = uvicorn.Config(arks.app.app, log_level=settings.log_level, lifespan="on")
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def serve(host: str, port: int, workers: int, backlog: int = 2048) -> int:
+    """Run workers on host:port until SIGTERM or SIGINT."""
+    L = get_logger()
+    sock = bind_socket(host, port, backlog)
+    preload()
+    # {pid: start time} of running workers
+    children: typing.Dict[int, float] = {}
+    stopping = False
+
+    def _spawn() -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(sock)
+            except BaseException:
+                L.exception("Worker %s failed", os.getpid())
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+        L.info("Started worker %s", pid)
+
+    def _stop(signum, frame) -> None:
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, _stop)
+    signal.signal(signal.SIGINT, _stop)
+    L.info("Listening on %s:%s with %s workers", host, port, workers)
+    for _ in range(workers):
+        _spawn()
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        L.warning("Worker %s exited with code %s", pid, os.waitstatus_to_exitcode(status))
+        wait = RESTART_DELAY - (time.monotonic() - started)
+        if wait > 0:
+            time.sleep(wait)
+        if not stopping:
+            _spawn()
+    sock.close()
+    return 0
@@ -0,0 +1,135 @@
+"""Opt-in capture of slow or sampled request traces.
+
+Each trace is a JSON summary of the request with the SQL statements it
+issued, plus a cProfile stats file when the request was sampled for
+profiling. Traces are kept in a directory holding at most a fixed number of
+traces, the oldest being removed first.
+"""
+
+import contextlib
+import contextvars
+import cProfile
+import io
+import json
+import os
+import pstats
+import time
+import typing
+
+import sqlalchemy
+import sqlalchemy.event
+
+# SQL statements of the current request, None when not capturing
+_statements: contextvars.ContextVar[typing.Optional[list]] = contextvars.ContextVar(
+    "arks_statements", default=None
+)
+# cProfile hooks the whole thread, so only one request is profiled at a time
+_profiling = False
+# Requests inside trace_request, and the number of other requests in flight
+# at some point while the current profile ran
+_active = 0
+_overlapping = 0
+
+
+def capture_statements(engine: sqlalchemy.engine.Engine) -> None:
+    """Record statements executed on engine into the current request trace."""
+
+    @sqlalchemy.event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        statements = _statements.get()
+        if statements is not None:
+            statements.append({"statement": statement, "start": time.perf_counter()})
+
+    @sqlalchemy.event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        statements = _statements.get()
+        if statements:
+            entry = statements[-1]
+            entry["ms"] = round(1000.0 * (time.perf_counter() - entry.pop("start")), 3)
+
+
+@contextlib.contextmanager
+def trace_request(profile: bool) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Collect SQL statements, and a profile if requested and none is running.
+
+    The yielded dict holds "statements", "elapsed_ms", "profile" (a
+    cProfile.Profile or None) and "overlapping" once the block exits.
+
+    The profiler hooks the event loop thread, not the request: a profile
+    also holds the work of every other request interleaved with it, counted
+    in "overlapping", and misses sync handlers run in the threadpool.
+    """
+    global _profiling, _active, _overlapping
+    trace: typing.Dict[str, typing.Any] = {"statements": [], "profile": None, "overlapping": 0}
+    token = _statements.set(trace["statements"])
+    profiler = None
+    if _profiling:
+        _overlapping += 1
+    elif profile:
+        _profiling = True
+        _overlapping = _active
+        profiler = cProfile.Profile()
+        profiler.enable()
+    _active += 1
+    t0 = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        trace["elapsed_ms"] = round(1000.0 * (time.perf_counter() - t0), 3)
+        _active -= 1
+        if profiler is not None:
+            profiler.disable()
+            _profiling = False
+            trace["profile"] = profiler
+            trace["overlapping"] = _overlapping
+        _statements.reset(token)
+
+
+class TraceRing:
+    """Directory of at most size traces, oldest removed first."""
+
+    def __init__(self, directory: str, size: int = 100):
+        self.directory = directory
+        self.size = size
+        self._seq = 0
+
+    def _trace_ids(self) -> typing.List[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith(".json"))
+
+    def write(self, summary: typing.Dict[str, typing.Any], profile: typing.Optional[cProfile.Profile] = None) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        self._seq += 1
+        trace_id = f"{time.time_ns()}-{os.getpid()}-{self._seq}"
+        summary = dict(summary, id=trace_id, profiled=profile is not None)
+        if profile is not None:
+            profile.dump_stats(os.path.join(self.directory, f"{trace_id}.prof"))
+        with open(os.path.join(self.directory, f"{trace_id}.json"), "w") as f:
+            json.dump(summary, f)
+        for old_id in self._trace_ids()[:-self.size]:
+            for ext in (".json", ".prof"):
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(os.path.join(self.directory, f"{old_id}{ext}"))
+        return trace_id
+
+    def list(self) -> typing.List[typing.Dict[str, typing.Any]]:
+        traces = []
+        for trace_id in self._trace_ids():
+            with contextlib.suppress(FileNotFoundError, ValueError):
+                traces.append(self.read(trace_id))
+        return traces
+
+    def read(self, trace_id: str) -> typing.Dict[str, typing.Any]:
+        with open(os.path.join(self.directory, f"{trace_id}.json"), "r") as f:
+            return json.load(f)
+
+    def profile_report(self, trace_id: str, sort: str = "cumulative", limit: int = 30) -> typing.Optional[str]:
+        path = os.path.join(self.directory, f"{trace_id}.prof")
+        if not os.path.exists(path):
+            return None
+        out = io.StringIO()
+        pstats.Stats(path, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
@@ -0,0 +1,77 @@
+"""Per client request rate limiting.
+
+Each client has a token bucket refilled at a fixed rate. Buckets are kept in
+a bounded LRU mapping, so memory stays fixed however many addresses a crawl
+comes from; a client whose bucket was dropped starts again with a full one.
+"""
+
+import collections
+import time
+import typing
+
+# Peer address of the in-process requests of bench, replay and prewarm, which
+# are never limited. Not a valid IP address, so no network client has it.
+INTERNAL_CLIENT = "arks-internal"
+
+
+class TokenBucketLimiter:
+    """Token buckets of rate requests per second and burst capacity per client."""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        maxsize: int,
+        clock: typing.Callable[[], float] = time.monotonic
+    ):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.maxsize = maxsize
+        self._clock = clock
+        # {client: (tokens, time of last update)}
+        self._buckets: "collections.OrderedDict[str, typing.Tuple[float, float]]" = collections.OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def acquire(self, client: str) -> float:
+        """Take a token for a request of client.
+
+        Returns 0 if the request is allowed, else the seconds until a token
+        is available.
+        """
+        now = self._clock()
+        bucket = self._buckets.get(client)
+        if bucket is None:
+            tokens = float(self.burst)
+        else:
+            tokens = min(float(self.burst), bucket[0] + (now - bucket[1]) * self.rate)
+            self._buckets.move_to_end(client)
+        if tokens >= 1.0:
+            self._buckets[client] = (tokens - 1.0, now)
+            wait = 0.0
+        else:
+            self._buckets[client] = (tokens, now)
+            wait = (1.0 - tokens) / self.rate
+        while len(self._buckets) > self.maxsize:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+def client_address(
+    peer: typing.Optional[str],
+    forwarded_for: typing.Optional[str],
+    proxy_count: int = 0
+) -> str:
+    """Address of the client a request is counted against.
+
+    With proxy_count proxies in front of the app, each appending the address
+    it received the request from to X-Forwarded-For, the client is the entry
+    proxy_count from the end. Entries before it are set by the client and
+    can not be trusted. Falls back to the peer address.
+    """
+    if proxy_count > 0 and forwarded_for:
+        addresses = [a.strip() for a in forwarded_for.split(",")]
+        if len(addresses) >= proxy_count and addresses[-proxy_count]:
+            return addresses[-proxy_count]
+    return peer or ""
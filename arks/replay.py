@@ -0,0 +1,186 @@
+"""Replay of resolver requests from a Unit access log.
+
+The log is streamed line by line, gzip compressed or not, and the requests
+Unit routes to the resolver application are sent to the app in-process or
+to a URL. Requests are sent at their logged pace scaled by a speed factor,
+or as fast as possible, and the responses compared with the logged status.
+"""
+
+import asyncio
+import datetime
+import gzip
+import re
+import time
+import typing
+import urllib.parse
+
+import httpx
+
+import arks.bench
+
+# Format of ansible/templates/unit.json.j2 access_log:
+# $remote_addr "$header_x_forwarded_for" [$time_local] "$request_line" $status
+# $body_bytes_sent "$header_referer" "$header_user_agent"
+LOG_LINE = re.compile(
+    r'^(?P<remote_addr>\S+) "(?P<forwarded_for>[^"]*)" \[(?P<time>[^\]]+)\] '
+    r'"(?P<request_line>[^"]*)" (?P<status>\d{3}) '
+)
+TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+# uri patterns of the route to the resolver application in
+# ansible/templates/unit.json.j2, Unit "~" regex patterns without the "~"
+RESOLVER_ROUTES = (
+    r"/\.info.*",
+    r"/api.*",
+    r"/([A-Za-z0-9\/;.\-]+(:|%3A).*)",
+)
+REPLAY_METHODS = ("GET", "HEAD")
+# Characters of a logged request target sent as is, others are percent-encoded
+_TARGET_SAFE = "".join(chr(c) for c in range(0x21, 0x7f))
+
+
+class LogRecord(typing.NamedTuple):
+    time: datetime.datetime
+    method: str
+    uri: str
+    status: int
+
+
+def open_log(path: str) -> typing.Iterator[str]:
+    """Lines of a log file, decompressed if gzip compressed."""
+    with open(path, "rb") as f:
+        is_gzip = f.read(2) == b"\x1f\x8b"
+    opener = gzip.open if is_gzip else open
+    with opener(path, "rt", encoding="utf-8", errors="replace") as f:
+        yield from f
+
+
+def parse_log(lines: typing.Iterable[str]) -> typing.Iterator[LogRecord]:
+    """Records of the access log lines, lines not in the log format are skipped."""
+    for line in lines:
+        match = LOG_LINE.match(line)
+        if match is None:
+            continue
+        parts = match.group("request_line").split(" ")
+        if len(parts) < 2:
+            continue
+        try:
+            logged = datetime.datetime.strptime(match.group("time"), TIME_FORMAT)
+        except ValueError:
+            continue
+        # The request target may contain spaces, the protocol never does
+        uri = " ".join(parts[1:-1]) if len(parts) > 2 else parts[1]
+        yield LogRecord(logged, parts[0], uri, int(match.group("status")))
+
+
+def resolver_records(
+    records: typing.Iterable[LogRecord],
+    routes: typing.Sequence[str] = RESOLVER_ROUTES
+) -> typing.Iterator[LogRecord]:
+    """Records of requests Unit routes to the resolver that can be replayed."""
+    patterns = [re.compile(route) for route in routes]
+    for record in records:
+        if record.method not in REPLAY_METHODS:
+            continue
+        path = record.uri.split("?", 1)[0]
+        # Unit regex patterns are not anchored
+        if any(pattern.search(path) for pattern in patterns):
+            yield record
+
+
+def request_url(base_url: httpx.URL, uri: str) -> httpx.URL:
+    """base_url with the logged request target as its path and query.
+
+    The target is not resolved as a URL reference, so a logged "//ark:/..."
+    keeps its path instead of being read as a host.
+    """
+    return base_url.copy_with(raw_path=urllib.parse.quote(uri, safe=_TARGET_SAFE).encode("ascii"))
+
+
+def request_kind(uri: str) -> str:
+    if uri.startswith("/.info"):
+        return "introspection"
+    if uri.startswith("/api"):
+        return "api"
+    return "resolve"
+
+
+async def replay(
+    client: httpx.AsyncClient,
+    records: typing.Iterable[LogRecord],
+    speed: float = 1.0,
+    concurrency: int = 50,
+    max_mismatches: int = 20
+) -> typing.Dict[str, typing.Any]:
+    """Send the requests of records and compare statuses with the logged ones.
+
+    With speed > 0 each request is sent at its logged time offset divided by
+    speed, with up to concurrency requests in flight. Requests are delayed
+    when the limit is reached and the delay is reported as lag. With speed 0
+    requests are sent as fast as concurrency allows.
+    """
+    limit = asyncio.Semaphore(max(1, concurrency))
+    latencies: typing.Dict[str, typing.List[float]] = {}
+    status: typing.Dict[str, int] = {}
+    mismatches: typing.Dict[str, int] = {}
+    examples: typing.List[typing.Dict[str, typing.Any]] = []
+    matched = 0
+    max_lag = 0.0
+    tasks: typing.Set[asyncio.Task] = set()
+
+    async def _send(record: LogRecord) -> None:
+        nonlocal matched
+        try:
+            t0 = time.perf_counter()
+            response = await client.request(record.method, request_url(client.base_url, record.uri))
+            dt = time.perf_counter() - t0
+        except (httpx.HTTPError, httpx.InvalidURL):
+            status["error"] = status.get("error", 0) + 1
+            return
+        finally:
+            limit.release()
+        latencies.setdefault(request_kind(record.uri), []).append(dt)
+        code = str(response.status_code)
+        status[code] = status.get(code, 0) + 1
+        if response.status_code == record.status:
+            matched += 1
+            return
+        key = f"{record.status}->{response.status_code}"
+        mismatches[key] = mismatches.get(key, 0) + 1
+        if len(examples) < max_mismatches:
+            examples.append({
+                "uri": record.uri,
+                "logged": record.status,
+                "status": response.status_code,
+                "location": response.headers.get("location"),
+            })
+
+    t_start = time.perf_counter()
+    first_time = None
+    for record in records:
+        if speed > 0:
+            if first_time is None:
+                first_time = record.time
+            due = t_start + (record.time - first_time).total_seconds() / speed
+            wait = due - time.perf_counter()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        await limit.acquire()
+        if speed > 0:
+            max_lag = max(max_lag, time.perf_counter() - due)
+        task = asyncio.create_task(_send(record))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*list(tasks))
+    elapsed = time.perf_counter() - t_start
+    overall = [dt for values in latencies.values() for dt in values]
+    total = len(overall)
+    return {
+        "overall": arks.bench.summarize(overall, elapsed),
+        "kinds": {kind: arks.bench.summarize(values) for kind, values in sorted(latencies.items())},
+        "status": dict(sorted(status.items())),
+        "status_match": round(matched / total, 4) if total else 0.0,
+        "mismatches": dict(sorted(mismatches.items(), key=lambda kv: -kv[1])),
+        "mismatch_examples": examples,
+        "max_lag_ms": round(1000.0 * max_lag, 3),
+    }
@@ -0,0 +1,347 @@
+"""Redirect resolution of identifiers ahead of the rslv resolver router.
+
+Only plain redirects are answered here. Introspection, synonyms and anything
+else that is not a simple redirect is left for the rslv router to handle.
+"""
+
+import functools
+import hashlib
+import logging
+import re
+import time
+import typing
+
+import fastapi.responses
+import rslv.lib_rslv
+import sqlalchemy.ext.asyncio
+
+import arks.cache
+import arks.metrics
+from arks import APP_NAME
+from arks.db import get_async_sessionmaker
+from arks.index import IndexEntry, PrefixIndex, PrefixSet, lookup_entry
+
+# Path prefixes served by routes other than the resolver
+RESERVED_PATHS = ("/.", "/_", "/api", "/static", "/favicon.ico")
+# Path prefix of rslv introspection requests
+INFO_PATH = "/.info/"
+
+
+def get_logger():
+    return logging.getLogger(APP_NAME)
+
+
+class Resolution(typing.NamedTuple):
+    """A redirect for an identifier matched to a definition."""
+    entry: IndexEntry
+    location: str
+    http_code: int
+
+
+def identifier_from_request(path: str, query_string: bytes) -> typing.Optional[str]:
+    """Return the identifier from a request path, or None if not a plain resolve request.
+
+    Requests carrying a query string (e.g. ``?info``) are left for the rslv router.
+    """
+    if query_string or path.startswith(RESERVED_PATHS) or ":" not in path:
+        return None
+    return path[1:]
+
+
+def identifier_from_path(path: str) -> typing.Optional[str]:
+    """Return the identifier of a resolve or introspection request path, else None."""
+    if path.startswith(INFO_PATH):
+        return path[len(INFO_PATH):] or None
+    if path.startswith(RESERVED_PATHS) or ":" not in path:
+        return None
+    return path[1:]
+
+
+def _split_alternatives(pattern: str) -> typing.List[str]:
+    """Split a regular expression on its top level "|" alternatives."""
+    alternatives = []
+    depth = 0
+    in_class = False
+    start = 0
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+        elif c == "(":
+            depth += 1
+        elif c == ")":
+            depth -= 1
+        elif c == "|" and depth == 0:
+            alternatives.append(pattern[start:i])
+            start = i + 1
+        i += 1
+    alternatives.append(pattern[start:])
+    return alternatives
+
+
+def _has_alternation(pattern: str) -> bool:
+    """True if pattern has a "|" outside of character classes, at any depth."""
+    in_class = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if in_class:
+            in_class = c != "]"
+        elif c == "[":
+            in_class = True
+        elif c == "|":
+            return True
+        i += 1
+    return False
+
+
+def literal_prefixes(pattern: str) -> typing.Optional[typing.Tuple[str, ...]]:
+    """Return literal text every match of pattern must start with, per alternative.
+
+    e.g. "(^https?://?n2t.net/)|(^https?://?arks.org/)" gives ("http", "http").
+    Returns None if any alternative is not anchored on literal text, or has
+    alternatives nested in a group, e.g. "((^n2t/)|(^arks/))".
+    """
+    prefixes = []
+    for alternative in _split_alternatives(pattern):
+        if _has_alternation(alternative):
+            return None
+        alternative = alternative.lstrip("(")
+        if not alternative.startswith("^"):
+            return None
+        literal = []
+        for i, c in enumerate(alternative[1:], start=1):
+            if not (c.isalnum() or c in "-_/:"):
+                break
+            # A quantifier makes the preceding character optional
+            if alternative[i + 1:i + 2] in ("?", "*", "{"):
+                break
+            literal.append(c)
+        if not literal:
+            return None
+        prefixes.append("".join(literal))
+    return tuple(prefixes)
+
+
+class IdentifierSplitter:
+    """Strips the service URL from identifiers and splits them into parts.
+
+    The service pattern is compiled once and, when every alternative is
+    anchored on literal text, only applied to identifiers starting with that
+    text. Split results are memoized in a bounded LRU cache.
+    """
+
+    def __init__(self, service_pattern: typing.Optional[str] = None, cache_size: int = 4096):
+        self._pattern = re.compile(service_pattern) if service_pattern else None
+        self._prefixes = literal_prefixes(service_pattern) if service_pattern else None
+        self._split = functools.lru_cache(maxsize=cache_size)(self._split_uncached)
+
+    def strip(self, identifier: str) -> str:
+        """Remove the service URL from the start of identifier."""
+        if self._pattern is None:
+            return identifier
+        if self._prefixes is not None and not identifier.startswith(self._prefixes):
+            return identifier
+        return self._pattern.sub("", identifier)
+
+    def _split_uncached(self, identifier: str) -> typing.Dict[str, typing.Any]:
+        return rslv.lib_rslv.split_identifier_string(self.strip(identifier))
+
+    def split(self, identifier: str) -> typing.Dict[str, typing.Any]:
+        """Return the parts of identifier, a copy the caller may modify."""
+        return dict(self._split(identifier))
+
+    def cache_info(self):
+        return self._split.cache_info()
+
+
+def is_introspection(
+    entry: IndexEntry, pid_parts: typing.Dict[str, typing.Any], auto_introspection: bool = True
+) -> bool:
+    """True if the rslv router answers pid_parts matched to entry with its introspection."""
+    return auto_introspection and (pid_parts.get("value") or "") == (entry.value or "")
+
+
+def resolve_entry(
+    entry: typing.Optional[IndexEntry],
+    pid_parts: typing.Dict[str, typing.Any],
+    auto_introspection: bool = True
+) -> typing.Optional[Resolution]:
+    """Expand the definition target for pid_parts if the match is a plain redirect."""
+    if entry is None or entry.synonym_for is not None or entry.target is None:
+        return None
+    if is_introspection(entry, pid_parts, auto_introspection):
+        return None
+    http_code = entry.http_code or 302
+    if not 300 <= http_code < 400:
+        return None
+    t0 = time.perf_counter()
+    location = rslv.lib_rslv.unsplit_identifier_string(entry.target, pid_parts)
+    arks.metrics.TEMPLATE_EXPANSION.observe(time.perf_counter() - t0)
+    return Resolution(entry, location, http_code)
+
+
+def redirect_headers(res: Resolution, max_age: int = 0) -> typing.Dict[str, str]:
+    """Cache validator and lifetime headers for a redirect response."""
+    digest = hashlib.blake2b(
+        f"{res.http_code} {res.location}".encode("utf-8"), digest_size=8
+    ).hexdigest()
+    headers = {"ETag": f'"{digest}"'}
+    if max_age > 0:
+        headers["Cache-Control"] = f"public, max-age={max_age}"
+    return headers
+
+
+def resolve(
+    index: PrefixIndex,
+    identifier: str,
+    splitter: IdentifierSplitter,
+    auto_introspection: bool = True
+) -> typing.Optional[Resolution]:
+    """Resolve identifier against the index, or None to defer to the rslv router."""
+    pid_parts = splitter.split(identifier)
+    t0 = time.perf_counter()
+    entry = index.lookup(pid_parts.get("scheme"), pid_parts.get("prefix"), pid_parts.get("value"))
+    arks.metrics.PREFIX_MATCH.observe(time.perf_counter() - t0)
+    return resolve_entry(entry, pid_parts, auto_introspection)
+
+
+async def resolve_async(
+    session_factory: sqlalchemy.ext.asyncio.async_sessionmaker,
+    identifier: str,
+    splitter: IdentifierSplitter,
+    auto_introspection: bool = True
+) -> typing.Optional[Resolution]:
+    """Resolve identifier with a database lookup on the async engine."""
+    pid_parts = splitter.split(identifier)
+    t0 = time.perf_counter()
+    async with session_factory() as dbsession:
+        entry = await dbsession.run_sync(
+            lookup_entry, pid_parts.get("scheme"), pid_parts.get("prefix"), pid_parts.get("value")
+        )
+    arks.metrics.PREFIX_MATCH.observe(time.perf_counter() - t0)
+    return resolve_entry(entry, pid_parts, auto_introspection)
+
+
+async def resolve_early(state: typing.Any, identifier: str) -> typing.Optional[Resolution]:
+    """Resolve identifier from the resolver index of app state, else with its async engine."""
+    settings = state.settings
+    if state.resolver_index is not None:
+        return resolve(
+            state.resolver_index,
+            identifier,
+            state.identifier_splitter,
+            auto_introspection=settings.auto_introspection,
+        )
+    return await resolve_async(
+        get_async_sessionmaker(state.async_dbengine),
+        identifier,
+        state.identifier_splitter,
+        auto_introspection=settings.auto_introspection,
+    )
+
+
+class RedirectMiddleware:
+    """ASGI middleware answering plain redirects from the resolver index or the async engine.
+
+    Added after the session middleware so that it runs first. Requests that
+    are not plain redirects, and all requests while neither app.state
+    resolver_index nor async_dbengine is set, continue on to the rslv router.
+    Outcomes, including deferrals to the router, are kept in
+    app.state.resolve_cache per identifier until the registry is updated or
+    the cache TTL passes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            return await self.app(scope, receive, send)
+        state = scope["app"].state
+        if state.resolver_index is None and state.async_dbengine is None:
+            return await self.app(scope, receive, send)
+        identifier = identifier_from_request(scope["path"], scope.get("query_string", b""))
+        if identifier is None:
+            return await self.app(scope, receive, send)
+        key = state.identifier_splitter.strip(identifier)
+        redirect = state.resolve_cache.get(key, state.registry_updated)
+        if redirect is arks.cache.MISSING:
+            try:
+                res = await resolve_early(state, identifier)
+                redirect = None
+                if res is not None:
+                    redirect = (res, redirect_headers(res, state.settings.redirect_max_age))
+                state.resolve_cache.set(key, redirect, state.registry_updated)
+            except Exception as e:
+                get_logger().debug("Early resolve failed for %s: %s", identifier, e)
+                redirect = None
+        if redirect is None:
+            return await self.app(scope, receive, send)
+        res, headers = redirect
+        response = fastapi.responses.RedirectResponse(
+            res.location, status_code=res.http_code, headers=headers
+        )
+        await response(scope, receive, send)
+
+
+def describe_match(
+    identifier: str,
+    entry: typing.Optional[IndexEntry],
+    pid_parts: typing.Dict[str, typing.Any],
+    auto_introspection: bool = True
+) -> typing.Dict[str, typing.Any]:
+    """Summary of the definition matched to an identifier, for batch responses.
+
+    An identifier answered with introspection, like the NAAN or shoulder
+    itself, has no target and http_code 200.
+    """
+    if entry is None:
+        return {"pid": identifier, "target": None, "http_code": 404, "uniq": None}
+    res = {"pid": identifier, "target": None, "http_code": entry.http_code or 302, "uniq": entry.uniq}
+    if entry.synonym_for is not None:
+        res["synonym_for"] = entry.synonym_for
+    elif is_introspection(entry, pid_parts, auto_introspection):
+        res["http_code"] = 200
+        res["introspection"] = True
+        return res
+    if entry.target is not None:
+        res["target"] = rslv.lib_rslv.unsplit_identifier_string(entry.target, pid_parts)
+    return res
+
+
+def iter_batch(
+    identifiers: typing.Iterable[str],
+    lookup: typing.Callable[
+        [typing.Optional[str], typing.Optional[str], typing.Optional[str]],
+        typing.Optional[IndexEntry]
+    ],
+    splitter: IdentifierSplitter,
+    auto_introspection: bool = True,
+    known: typing.Optional[PrefixSet] = None
+) -> typing.Iterator[typing.Dict[str, typing.Any]]:
+    """Match each identifier with lookup(scheme, prefix, value).
+
+    With known, identifiers with an unregistered NAAN are not found, as
+    answered by arks.notfound.NotFoundMiddleware.
+    """
+    for identifier in identifiers:
+        try:
+            pid_parts = splitter.split(identifier)
+        except Exception as e:
+            yield {"pid": identifier, "target": None, "http_code": 400, "uniq": None, "error": str(e)}
+            continue
+        if known is not None and known.is_unregistered(pid_parts.get("scheme"), pid_parts.get("prefix")):
+            yield describe_match(identifier, None, pid_parts)
+            continue
+        entry = lookup(pid_parts.get("scheme"), pid_parts.get("prefix"), pid_parts.get("value"))
+        yield describe_match(identifier, entry, pid_parts, auto_introspection)
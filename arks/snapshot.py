@@ -0,0 +1,285 @@
+"""Compact read-only registry snapshot, memory mapped by the app.
+
+A snapshot holds the same definitions and longest match semantics as
+arks.index.PrefixIndex in a single binary file. Lookups binary search the
+mapped file, so worker processes share the file pages through the OS page
+cache instead of each holding a copy of the index, and startup only maps the
+file. Snapshots are written to a temporary file and renamed into place, so a
+new snapshot can be deployed while the app is reading the old one.
+
+Layout, all integers little endian:
+
+    header      HEADER
+    string idx  n_strings + 1 uint32 offsets into string data
+    string data UTF-8 bytes of each distinct string
+    entries     n_entries ENTRY records
+    prefixes    n_prefixes PREFIX records sorted by key "scheme\\0prefix",
+                the scheme level entry having key "scheme\\0"
+    shoulders   n_shoulders SHOULDER records sorted by key
+                "scheme\\0prefix\\0value"
+    lengths     uint16 distinct shoulder lengths of each prefix, longest first
+"""
+
+import mmap
+import os
+import struct
+import typing
+
+from arks.index import IndexEntry, PrefixIndex
+
+MAGIC = b"ARKSSNAP"
+FORMAT_VERSION = 1
+# String or entry id standing for None
+NONE = 0xFFFFFFFF
+
+# magic, version, updated string id, counts of strings, entries, prefixes,
+# shoulders and lengths, then offsets of the string index, string data,
+# entries, prefixes, shoulders and lengths sections
+HEADER = struct.Struct("<8s7I6Q")
+STRING_OFFSET = struct.Struct("<I")
+# Start and end offsets of a string, two consecutive string index items
+STRING_SPAN = struct.Struct("<2I")
+# uniq, scheme, prefix, value, target and synonym_for string ids, http_code
+ENTRY = struct.Struct("<6Ii")
+# key string id, prefix level entry id, first length, number of lengths
+PREFIX = struct.Struct("<4I")
+# key string id, entry id
+SHOULDER = struct.Struct("<2I")
+LENGTH = struct.Struct("<H")
+
+
+def file_id(path: str) -> typing.Tuple[int, int]:
+    """Identity of the file at path, changed by replacing the file."""
+    st = os.stat(path)
+    return (st.st_ino, st.st_mtime_ns)
+
+
+def _prefix_key(scheme: str, prefix: typing.Optional[str]) -> str:
+    return f"{scheme}\0{prefix or ''}"
+
+
+def _shoulder_key(scheme: str, prefix: str, value: str) -> str:
+    return f"{scheme}\0{prefix}\0{value}"
+
+
+def write_snapshot(
+    path: str,
+    entries: typing.Iterable[IndexEntry],
+    updated: typing.Optional[str] = None
+) -> int:
+    """Write entries to a snapshot file at path, returning the number of entries.
+
+    updated is recorded as the snapshot generation, e.g. the registry
+    "updated" metadata.
+    """
+    index = PrefixIndex(entries)
+    strings: typing.Dict[str, int] = {}
+
+    def _sid(s: typing.Optional[str]) -> int:
+        if s is None:
+            return NONE
+        sid = strings.get(s)
+        if sid is None:
+            sid = len(strings)
+            strings[s] = sid
+        return sid
+
+    entry_ids: typing.Dict[str, int] = {}
+    entry_data = bytearray()
+    for entry in index:
+        entry_ids[entry.uniq] = len(entry_ids)
+        entry_data += ENTRY.pack(
+            _sid(entry.uniq),
+            _sid(entry.scheme),
+            _sid(entry.prefix),
+            _sid(entry.value),
+            _sid(entry.target),
+            _sid(entry.synonym_for),
+            -1 if entry.http_code is None else entry.http_code,
+        )
+    prefix_records = []
+    shoulder_records = []
+    lengths: typing.List[int] = []
+    for scheme, (scheme_entry, prefixes) in index._schemes.items():
+        prefix_records.append((
+            _prefix_key(scheme, None).encode("utf-8"),
+            _sid(_prefix_key(scheme, None)),
+            NONE if scheme_entry is None else entry_ids[scheme_entry.uniq],
+            0,
+            0,
+        ))
+        for prefix, node in prefixes.items():
+            key = _prefix_key(scheme, prefix)
+            prefix_records.append((
+                key.encode("utf-8"),
+                _sid(key),
+                NONE if node.entry is None else entry_ids[node.entry.uniq],
+                len(lengths),
+                len(node.lengths),
+            ))
+            lengths.extend(node.lengths)
+            for value, entry in node.shoulders.items():
+                key = _shoulder_key(scheme, prefix, value)
+                shoulder_records.append((key.encode("utf-8"), _sid(key), entry_ids[entry.uniq]))
+    if lengths and max(lengths) > 0xFFFF:
+        raise ValueError("Shoulder too long for snapshot")
+    updated_sid = _sid(updated)
+    # Records are binary searched by the encoded key bytes
+    prefix_records.sort()
+    shoulder_records.sort()
+
+    string_index = bytearray()
+    string_data = bytearray()
+    for s in strings:
+        string_index += STRING_OFFSET.pack(len(string_data))
+        string_data += s.encode("utf-8")
+    string_index += STRING_OFFSET.pack(len(string_data))
+    prefix_data = b"".join(PREFIX.pack(*r[1:]) for r in prefix_records)
+    shoulder_data = b"".join(SHOULDER.pack(*r[1:]) for r in shoulder_records)
+    length_data = b"".join(LENGTH.pack(n) for n in lengths)
+
+    sections = [string_index, string_data, entry_data, prefix_data, shoulder_data, length_data]
+    offsets = []
+    offset = HEADER.size
+    for section in sections:
+        offsets.append(offset)
+        offset += len(section)
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        updated_sid,
+        len(strings),
+        len(entry_ids),
+        len(prefix_records),
+        len(shoulder_records),
+        len(lengths),
+        *offsets,
+    )
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(entry_ids)
+
+
+class SnapshotIndex:
+    """PrefixIndex interface over a memory mapped snapshot file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            # file_id of the mapped file
+            self.file_id = (st.st_ino, st.st_mtime_ns)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < HEADER.size:
+            raise ValueError(f"{path} is not an arks snapshot")
+        (
+            magic,
+            version,
+            updated_sid,
+            self._n_strings,
+            self._n_entries,
+            self._n_prefixes,
+            self._n_shoulders,
+            _,
+            self._string_index,
+            self._string_data,
+            self._entries,
+            self._prefixes,
+            self._shoulders,
+            self._lengths,
+        ) = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an arks snapshot")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {version} in {path}")
+        self.updated = self._string(updated_sid)
+
+    def _bytes(self, sid: int) -> bytes:
+        start, end = STRING_SPAN.unpack_from(self._mm, self._string_index + STRING_OFFSET.size * sid)
+        return self._mm[self._string_data + start:self._string_data + end]
+
+    def _string(self, sid: int) -> typing.Optional[str]:
+        if sid == NONE:
+            return None
+        return self._bytes(sid).decode("utf-8")
+
+    def _entry(self, eid: int) -> typing.Optional[IndexEntry]:
+        if eid == NONE:
+            return None
+        *sids, http_code = ENTRY.unpack_from(self._mm, self._entries + eid * ENTRY.size)
+        uniq, scheme, prefix, value, target, synonym_for = (self._string(sid) for sid in sids)
+        return IndexEntry(
+            uniq, scheme, prefix, value, target, None if http_code < 0 else http_code, synonym_for
+        )
+
+    def _search(
+        self, offset: int, count: int, record: struct.Struct, key: bytes
+    ) -> typing.Optional[typing.Tuple[int, ...]]:
+        """Binary search records sorted by the string their first field refers to."""
+        lo = 0
+        hi = count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            fields = record.unpack_from(self._mm, offset + mid * record.size)
+            k = self._bytes(fields[0])
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return fields
+        return None
+
+    def _find_prefix(self, scheme: str, prefix: typing.Optional[str]) -> typing.Optional[typing.Tuple[int, ...]]:
+        key = _prefix_key(scheme, prefix).encode("utf-8")
+        return self._search(self._prefixes, self._n_prefixes, PREFIX, key)
+
+    def __len__(self) -> int:
+        return self._n_entries
+
+    def __iter__(self) -> typing.Iterator[IndexEntry]:
+        for eid in range(self._n_entries):
+            yield self._entry(eid)
+
+    def has_prefix(self, scheme: str, prefix: str) -> bool:
+        if not scheme or not prefix:
+            return False
+        return self._find_prefix(scheme, prefix) is not None
+
+    def lookup(
+        self,
+        scheme: typing.Optional[str],
+        prefix: typing.Optional[str],
+        value: typing.Optional[str]
+    ) -> typing.Optional[IndexEntry]:
+        """Return the most specific definition matching the identifier parts."""
+        if not scheme:
+            return None
+        if prefix:
+            found = self._find_prefix(scheme, prefix)
+            if found is not None:
+                _, eid, first, count = found
+                if value and count:
+                    n = len(value)
+                    for i in range(first, first + count):
+                        (length,) = LENGTH.unpack_from(self._mm, self._lengths + i * LENGTH.size)
+                        if length <= n:
+                            key = _shoulder_key(scheme, prefix, value[:length]).encode("utf-8")
+                            shoulder = self._search(self._shoulders, self._n_shoulders, SHOULDER, key)
+                            if shoulder is not None:
+                                return self._entry(shoulder[1])
+                if eid != NONE:
+                    return self._entry(eid)
+        found = self._find_prefix(scheme, None)
+        if found is None:
+            return None
+        return self._entry(found[1])
+
+    def close(self) -> None:
+        self._mm.close()
@@ -0,0 +1,66 @@
+import asyncio
+
+import fastapi
+import httpx
+import pytest
+
+
+def _stand_in_app(middleware, **state):
+    """App standing in for the rslv router behind middleware.
+
+    Introspection of "missing..." and identifiers containing "missing" are
+    answered 404, others 200. app.state.calls counts requests that reached
+    the routes.
+    """
+    app = fastapi.FastAPI()
+    for name, value in state.items():
+        setattr(app.state, name, value)
+    app.state.calls = 0
+
+    def not_found():
+        return fastapi.responses.JSONResponse({"detail": "nope"}, status_code=404, headers={"X-Miss": "1"})
+
+    @app.get("/.info/{identifier:path}")
+    async def info(identifier: str):
+        app.state.calls += 1
+        if identifier.startswith("missing"):
+            return not_found()
+        return fastapi.responses.JSONResponse(
+            {"info": identifier, "padding": "x" * 1000}, headers={"X-Definition": identifier}
+        )
+
+    @app.api_route("/{identifier:path}", methods=["GET", "HEAD", "POST"])
+    async def resolve(identifier: str):
+        app.state.calls += 1
+        if "missing" in identifier:
+            return not_found()
+        return {"rslv": identifier}
+
+    app.add_middleware(middleware)
+    return app
+
+
+def _run_requests(app, requests):
+    """Send (method, path) or (method, path, headers) requests to app in order."""
+
+    async def _run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            responses = []
+            for method, path, *headers in requests:
+                responses.append(await client.request(method, path, headers=headers[0] if headers else None))
+            return responses
+
+    return asyncio.run(_run())
+
+
+@pytest.fixture
+def make_app():
+    """make_app(middleware, **state): a stand-in rslv app with middleware and app.state set."""
+    return _stand_in_app
+
+
+@pytest.fixture
+def run():
+    """run(app, requests): the responses of app to requests."""
+    return _run_requests
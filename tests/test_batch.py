@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+import arks.index
+import arks.resolve
+from arks.app import iter_ndjson_chunks, read_batch_identifiers
+
+ENTRIES = [
+    arks.index.IndexEntry("ark:/", "ark", None, None, "/.info/${pid}", 302),
+    arks.index.IndexEntry("ark:12345/", "ark", "12345", None, "https://a.example.org/${value}", 302),
+    arks.index.IndexEntry("ark:12345/x5", "ark", "12345", "x5", "https://b.example.org/${value}", 302),
+]
+
+
+def test_read_json_list():
+    assert read_batch_identifiers(b'["ark:/1/a", "ark:/2/b"]', "application/json") == ["ark:/1/a", "ark:/2/b"]
+
+
+def test_read_ndjson():
+    body = b'"ark:/1/a"\n\n"ark:/2/b"\n'
+    assert read_batch_identifiers(body, "application/x-ndjson") == ["ark:/1/a", "ark:/2/b"]
+
+
+@pytest.mark.parametrize(
+    "body,content_type",
+    [
+        (b'{"pid": "ark:/1/a"}', "application/json"),
+        (b'["ark:/1/a", null]', "application/json"),
+        (b'["ark:/1/a", 1]', "application/json"),
+        (b'[{"x": 1}]', "application/json"),
+        (b'"ark:/1/a"\nnull\n', "application/x-ndjson"),
+        (b'"ark:/1/a"\n2\n', "application/x-ndjson"),
+        (b'["ark:/1/a"', "application/json"),
+    ],
+)
+def test_rejects_non_string_identifiers(body, content_type):
+    with pytest.raises(ValueError):
+        read_batch_identifiers(body, content_type)
+
+
+def match(identifiers, **kwargs):
+    index = arks.index.PrefixIndex(ENTRIES)
+    splitter = arks.resolve.IdentifierSplitter()
+    return {
+        res["pid"]: res
+        for res in arks.resolve.iter_batch(identifiers, index.lookup, splitter, **kwargs)
+    }
+
+
+def test_batch_reports_introspection():
+    res = match(["ark:/12345", "ark:/12345/x5", "ark:/12345/x5y"])
+    assert res["ark:/12345"]["http_code"] == 200
+    assert res["ark:/12345"]["target"] is None
+    assert res["ark:/12345/x5"]["introspection"]
+    assert res["ark:/12345/x5y"]["uniq"] == "ark:12345/x5"
+    assert res["ark:/12345/x5y"]["http_code"] == 302
+    # Without auto introspection the NAAN itself is redirected
+    res = match(["ark:/12345"], auto_introspection=False)
+    assert res["ark:/12345"]["http_code"] == 302
+    assert "introspection" not in res["ark:/12345"]
+
+
+def test_batch_rejects_unknown_naans():
+    identifiers = ["ark:/99999/a", "ark:/12345/a"]
+    assert match(identifiers)["ark:/99999/a"]["uniq"] == "ark:/"
+    known = arks.index.PrefixSet((e.scheme, e.prefix) for e in ENTRIES)
+    res = match(identifiers, known=known)
+    assert res["ark:/99999/a"] == {"pid": "ark:/99999/a", "target": None, "http_code": 404, "uniq": None}
+    assert res["ark:/12345/a"]["uniq"] == "ark:12345/"
+
+
+def test_ndjson_chunks():
+    results = [{"i": i} for i in range(7)]
+    chunks = list(iter_ndjson_chunks(results, lines=3))
+    assert [chunk.count(b"\n") for chunk in chunks] == [3, 3, 1]
+    lines = b"".join(chunks).decode("utf-8").splitlines()
+    assert [json.loads(line) for line in lines] == results
+    assert list(iter_ndjson_chunks([], lines=3)) == []
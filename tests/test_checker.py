@@ -0,0 +1,177 @@
+import asyncio
+
+import httpx
+
+import arks.checker
+
+
+def routes(table):
+    """MockTransport handler answering url: (status, location) from table."""
+
+    def handler(request):
+        url = str(request.url)
+        if url not in table:
+            raise httpx.ConnectError("unreachable", request=request)
+        status, location = table[url]
+        headers = {"location": location} if location else {}
+        return httpx.Response(status, headers=headers)
+
+    return handler
+
+
+def follow(table, url, **kwargs):
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(routes(table))) as client:
+            return await arks.checker.follow_redirects_until(client, url, {}, **kwargs)
+
+    return asyncio.run(_run())
+
+
+def test_status():
+    res = follow({"https://a.example.org/x": (200, None)}, "https://a.example.org/x")
+    assert res.status_code == 200
+    assert str(res.final_url) == "https://a.example.org/x"
+    assert res.error is None
+    assert isinstance(res.msecs, float) and res.msecs >= 0
+
+
+def test_redirect_elsewhere_is_not_followed():
+    table = {
+        "https://a.example.org/x": (302, "https://b.example.org/y"),
+        "https://b.example.org/y": (200, None),
+    }
+    res = follow(table, "https://a.example.org/x")
+    assert res.status_code == 302
+    assert str(res.final_url) == "https://b.example.org/y"
+
+
+def test_redirect_stops_at_first_other_host():
+    table = {
+        "https://a.example.org/x": (301, "https://a.example.org/y"),
+        "https://a.example.org/y": (302, "https://b.example.org/z"),
+        "https://b.example.org/z": (200, None),
+    }
+    res = follow(table, "https://a.example.org/x", stop_hosts=["https://a.example.org/"])
+    assert res.status_code == 302
+    assert str(res.final_url) == "https://b.example.org/z"
+
+
+def test_follow_all():
+    table = {
+        "https://a.example.org/x": (301, "https://b.example.org/y"),
+        "https://b.example.org/y": (302, "https://c.example.org/z"),
+        "https://c.example.org/z": (404, None),
+    }
+    res = follow(table, "https://a.example.org/x", follow_all=True)
+    assert res.status_code == 404
+    assert str(res.final_url) == "https://c.example.org/z"
+    assert res.error is None
+
+
+def test_redirect_loop():
+    table = {
+        "https://a.example.org/x": (302, "https://b.example.org/y"),
+        "https://b.example.org/y": (302, "https://a.example.org/x"),
+    }
+    res = follow(table, "https://a.example.org/x", follow_all=True)
+    assert "loop" in res.error
+
+
+def test_max_redirects():
+    table = {f"https://a.example.org/{i}": (302, f"https://a.example.org/{i + 1}") for i in range(20)}
+    res = follow(table, "https://a.example.org/0", follow_all=True, max_redirects=3)
+    assert "3 redirects" in res.error
+
+
+def test_connection_error():
+    res = follow({}, "https://down.example.org/x")
+    assert res.error == "unreachable"
+    assert res.msecs >= 0
+
+
+def test_check_targets():
+    in_flight = {}
+    max_in_flight = {}
+
+    async def handler(request):
+        host = request.url.host
+        in_flight[host] = in_flight.get(host, 0) + 1
+        max_in_flight[host] = max(max_in_flight.get(host, 0), in_flight[host])
+        await asyncio.sleep(0.01)
+        in_flight[host] -= 1
+        if host == "down.example.org":
+            raise httpx.ConnectError("unreachable", request=request)
+        if request.url.path.endswith("/moved"):
+            return httpx.Response(302, headers={"location": "https://elsewhere.example.org/"})
+        return httpx.Response(200)
+
+    targets = [arks.checker.Target(f"ark:a/{i}", f"https://a.example.org/{i}") for i in range(6)]
+    targets.append(arks.checker.Target("ark:b/moved", "https://b.example.org/moved"))
+    targets.append(arks.checker.Target("ark:c/", "https://down.example.org/"))
+    results = []
+
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await arks.checker.check_targets(
+                targets, results.append, concurrency=8, per_host=2, client=client
+            )
+
+    counts = asyncio.run(_run())
+    assert counts == {"200": 6, "302": 1, "error": 1}
+    assert max_in_flight["a.example.org"] == 2
+    by_uniq = {r["uniq"]: r for r in results}
+    assert len(by_uniq) == len(targets)
+    assert by_uniq["ark:b/moved"]["final_url"] == "https://elsewhere.example.org/"
+    assert by_uniq["ark:c/"]["status_code"] is None
+    assert by_uniq["ark:c/"]["error"] == "unreachable"
+    assert all(r["msecs"] >= 0 and r["checked_at"] for r in results)
+
+
+def test_check_targets_same_host_run_does_not_stall():
+    state = {"in_flight": 0, "peak": 0, "a_done": False}
+
+    async def handler(request):
+        state["in_flight"] += 1
+        if not state["a_done"]:
+            state["peak"] = max(state["peak"], state["in_flight"])
+        await asyncio.sleep(0.02)
+        state["in_flight"] -= 1
+        if request.url.host == "a.example.org":
+            state["a_done"] = True
+        return httpx.Response(200)
+
+    targets = [arks.checker.Target(f"ark:a/{i}", f"https://a.example.org/{i}") for i in range(10)]
+    targets += [arks.checker.Target(f"ark:h{i}/", f"https://h{i}.example.org/") for i in range(40)]
+    results = []
+
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await arks.checker.check_targets(
+                targets, results.append, concurrency=10, per_host=2, client=client
+            )
+
+    assert asyncio.run(_run()) == {"200": 50}
+    assert len({r["uniq"] for r in results}) == 50
+    # Other hosts are checked while a.example.org is at per_host
+    assert state["peak"] == 10
+
+
+def test_check_targets_deferred_limit(monkeypatch):
+    monkeypatch.setattr(arks.checker, "MAX_DEFERRED", 3)
+
+    async def handler(request):
+        await asyncio.sleep(0.001)
+        return httpx.Response(200)
+
+    targets = [arks.checker.Target(f"ark:a/{i}", f"https://a.example.org/{i}") for i in range(20)]
+    targets.append(arks.checker.Target("ark:b/", "https://b.example.org/"))
+    results = []
+
+    async def _run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await arks.checker.check_targets(
+                targets, results.append, concurrency=4, per_host=1, client=client
+            )
+
+    assert asyncio.run(_run()) == {"200": 21}
+    assert sorted(r["uniq"] for r in results) == sorted(t.uniq for t in targets)
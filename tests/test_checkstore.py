@@ -0,0 +1,88 @@
+import datetime
+
+import pytest
+
+import arks.checker
+import arks.checkstore
+
+NOW = datetime.datetime(2024, 5, 1, 12, 0, 0)
+HOUR = datetime.timedelta(hours=1)
+
+
+def targets(*uniqs, host="a.example.org"):
+    return [arks.checker.Target(uniq, f"https://{host}/{uniq}") for uniq in uniqs]
+
+
+def select(items, last_checks=None, backoff=None, **kwargs):
+    skipped = {}
+    selected = arks.checkstore.select_targets(
+        items, last_checks or {}, backoff or {}, NOW, skipped=skipped, **kwargs
+    )
+    return [t.uniq for t in selected], skipped
+
+
+def test_select_skips_fresh_checks():
+    last_checks = {"fresh": NOW - HOUR, "stale": NOW - 30 * HOUR}
+    selected, skipped = select(targets("fresh", "stale", "new"), last_checks, max_age=24 * HOUR)
+    assert selected == ["stale", "new"]
+    assert skipped == {"fresh": 1}
+    # Without max_age every stored check is due again
+    assert select(targets("fresh", "stale"), last_checks)[0] == ["fresh", "stale"]
+
+
+def test_select_changed_only():
+    last_checks = {"same": NOW - HOUR, "edited": NOW - HOUR, "nodigest": NOW - HOUR}
+    record_updates = {"same": NOW - 2 * HOUR, "edited": NOW - HOUR / 2, "new": NOW}
+    selected, skipped = select(
+        targets("same", "edited", "nodigest", "new"),
+        last_checks,
+        max_age=24 * HOUR,
+        record_updates=record_updates,
+    )
+    # A changed definition is checked even within max_age, a never checked one always
+    assert selected == ["edited", "new"]
+    assert skipped == {"unchanged": 2}
+
+
+def test_select_skips_backed_off_hosts():
+    items = targets("x", host="down.example.org") + targets("y", host="up.example.org")
+    backoff = {
+        "down.example.org": (2, NOW + HOUR),
+        "up.example.org": (5, NOW - HOUR),
+    }
+    selected, skipped = select(items, backoff=backoff)
+    assert selected == ["y"]
+    assert skipped == {"backoff": 1}
+
+
+def test_backoff_period():
+    assert arks.checkstore.backoff_period(0) == arks.checkstore.BACKOFF_BASE
+    assert arks.checkstore.backoff_period(1) == arks.checkstore.BACKOFF_BASE
+    assert arks.checkstore.backoff_period(3) == 4 * arks.checkstore.BACKOFF_BASE
+    assert arks.checkstore.backoff_period(30) == arks.checkstore.BACKOFF_MAX
+
+
+def test_update_hosts(tmp_path):
+    store = arks.checkstore.CheckStore(f"sqlite:///{tmp_path}/checks.sqlite")
+    try:
+        store.update_hosts({"a": False, "b": False}, NOW)
+        store.update_hosts({"a": False, "b": True, "c": True}, NOW + HOUR)
+        backoff = store.backoff()
+    finally:
+        store.close()
+    assert backoff == {"a": (2, NOW + HOUR + arks.checkstore.backoff_period(2))}
+
+
+def test_store_folder_is_created(tmp_path):
+    url = f"sqlite:///{tmp_path}/missing/checks.sqlite"
+    store = arks.checkstore.CheckStore(url)
+    store.close()
+    assert (tmp_path / "missing" / "checks.sqlite").exists()
+
+
+def test_default_store_url():
+    assert arks.checkstore.default_store_url("sqlite:////ezid/var/data/registry.sqlite") == (
+        "sqlite:////ezid/var/data/target_checks.sqlite"
+    )
+    with pytest.raises(ValueError):
+        arks.checkstore.default_store_url("postgresql://arks@localhost/registry")
@@ -0,0 +1,85 @@
+import pytest
+
+import arks.cache
+import arks.introspection
+
+
+@pytest.mark.parametrize(
+    "method,path,query,expected",
+    [
+        ("GET", "/.info/ark:/12345", b"", "/.info/ark:/12345"),
+        ("GET", "/ark:/12345/x5", b"info", "/ark:/12345/x5?info"),
+        ("GET", "/ark:/12345/x5", b"?", "/ark:/12345/x5??"),
+        ("GET", "/ark:/12345/x5", b"", None),
+        ("GET", "/ark:/12345/x5", b"a=1", None),
+        ("HEAD", "/.info/ark:/12345", b"", None),
+        ("GET", "/.info/", b"", None),
+        ("GET", "/_about", b"info", None),
+    ],
+)
+def test_cache_key(method, path, query, expected):
+    assert arks.introspection.cache_key(method, path, query) == expected
+
+
+def make_info_app(make_app):
+    return make_app(
+        arks.introspection.InfoCacheMiddleware,
+        info_cache=arks.cache.TTLCache(100, 60.0),
+        registry_updated="1",
+    )
+
+
+def test_cached_document_keeps_router_headers(make_app, run):
+    app = make_info_app(make_app)
+    first, second, zipped = run(app, [
+        ("GET", "/.info/ark:/12345", {"accept-encoding": "identity"}),
+        ("GET", "/.info/ark:/12345", {"accept-encoding": "identity"}),
+        ("GET", "/.info/ark:/12345", {"accept-encoding": "br;q=0, gzip"}),
+    ])
+    assert app.state.calls == 1
+    assert first.content == second.content
+    assert second.headers["x-definition"] == "ark:/12345"
+    assert second.headers["content-type"] == "application/json"
+    assert second.headers["etag"] == first.headers["etag"]
+    assert "Accept-Encoding" in second.headers["vary"]
+    assert zipped.headers["content-encoding"] == "gzip"
+    assert zipped.json() == first.json()
+
+
+def test_not_modified(make_app, run):
+    app = make_info_app(make_app)
+    first, = run(app, [("GET", "/.info/ark:/12345")])
+    second, = run(app, [("GET", "/.info/ark:/12345", {"if-none-match": first.headers["etag"]})])
+    assert second.status_code == 304
+    assert second.content == b""
+
+
+def test_only_introspection_200_is_cached(make_app, run):
+    app = make_info_app(make_app)
+    responses = run(app, [
+        ("GET", "/.info/missing"),
+        ("GET", "/.info/missing"),
+        ("GET", "/ark:/12345/x5"),
+        ("GET", "/ark:/12345/x5"),
+    ])
+    assert [r.status_code for r in responses] == [404, 404, 200, 200]
+    assert app.state.calls == 4
+    assert len(app.state.info_cache) == 0
+
+
+def test_registry_update_drops_documents(make_app, run):
+    app = make_info_app(make_app)
+    run(app, [("GET", "/.info/ark:/12345")])
+    app.state.registry_updated = "2"
+    run(app, [("GET", "/.info/ark:/12345")])
+    assert app.state.calls == 2
+
+
+def test_large_documents_are_not_cached(make_app, run, monkeypatch):
+    monkeypatch.setattr(arks.introspection, "MAX_BODY_SIZE", 100)
+    app = make_info_app(make_app)
+    first, second = run(app, [("GET", "/.info/ark:/12345"), ("GET", "/.info/ark:/12345")])
+    assert first.json() == second.json()
+    assert first.json()["info"] == "ark:/12345"
+    assert "etag" not in first.headers
+    assert app.state.calls == 2
@@ -0,0 +1,89 @@
+import sqlalchemy
+import sqlalchemy.orm
+
+import rslv.lib_rslv.piddefine
+
+import arks.db
+import arks.loader
+import arks.naans
+
+
+def naan(what, target="https://example.org/${value}"):
+    return {"what": what, "rtype": "PublicNAAN", "target": {"url": target, "http_code": 302}}
+
+
+def shoulder(what, naan, value, target="https://example.org/s/${value}"):
+    return {
+        "what": what,
+        "rtype": "PublicNAANShoulder",
+        "naan": naan,
+        "shoulder": value,
+        "target": {"url": target, "http_code": 302},
+    }
+
+
+def uniq_of(record):
+    return arks.loader.record_to_definition(dict(record)).uniq
+
+
+def load(db_str, records, day, bulk=False):
+    doc = {
+        "metadata": {"date_modified": f"2100-01-{day:02d}T00:00:00"},
+        "data": [dict(r) for r in records],
+    }
+    return arks.loader.records_to_db(doc, db_str, bulk=bulk)
+
+
+def stored(db_str):
+    engine = arks.db.get_writer_engine(db_str)
+    PD = rslv.lib_rslv.piddefine.PidDefinition
+    with sqlalchemy.orm.Session(engine) as session:
+        uniqs = set(session.scalars(sqlalchemy.select(PD.uniq)))
+        digests = arks.naans.load_digests(session)
+    return uniqs, digests
+
+
+def test_unchanged_records_are_skipped(tmp_path):
+    db_str = f"sqlite:///{tmp_path}/registry.sqlite"
+    records = [naan("12345"), shoulder("12345/x5", "12345", "x5")]
+    assert load(db_str, records, 1)[1] == 2
+    total, added, updated, _, removed = load(db_str, records, 2)
+    assert (total, added, updated, removed) == (2, 0, 0, 0)
+
+
+def test_renamed_record_keeps_definition(tmp_path):
+    for bulk in (False, True):
+        db_str = f"sqlite:///{tmp_path}/registry_{bulk}.sqlite"
+        old = shoulder("12345/x5", "12345", "x5")
+        new = shoulder("ark:/12345/x5", "12345", "x5")
+        load(db_str, [naan("12345"), old], 1, bulk=bulk)
+        removed = load(db_str, [naan("12345"), new], 2, bulk=bulk)[4]
+        uniqs, digests = stored(db_str)
+        assert removed == 0
+        assert uniq_of(new) in uniqs
+        assert "12345/x5" not in digests
+        assert digests["ark:/12345/x5"][0] == uniq_of(new)
+
+
+def test_changed_uniq_removes_old_definition(tmp_path):
+    for bulk in (False, True):
+        db_str = f"sqlite:///{tmp_path}/registry_{bulk}.sqlite"
+        old = shoulder("12345/x5", "12345", "x5")
+        new = shoulder("12345/x5", "12345", "x6")
+        load(db_str, [naan("12345"), old], 1, bulk=bulk)
+        removed = load(db_str, [naan("12345"), new], 2, bulk=bulk)[4]
+        uniqs, digests = stored(db_str)
+        assert removed == 1
+        assert uniq_of(old) not in uniqs
+        assert uniq_of(new) in uniqs
+        assert digests["12345/x5"][0] == uniq_of(new)
+
+
+def test_removed_record_removes_definition(tmp_path):
+    db_str = f"sqlite:///{tmp_path}/registry.sqlite"
+    gone = shoulder("12345/x5", "12345", "x5")
+    load(db_str, [naan("12345"), gone], 1)
+    assert load(db_str, [naan("12345")], 2)[4] == 1
+    uniqs, digests = stored(db_str)
+    assert uniq_of(gone) not in uniqs
+    assert "12345/x5" not in digests
@@ -0,0 +1,147 @@
+import datetime
+import json
+
+import httpx
+import pytest
+import sqlalchemy.orm
+
+import arks.db
+import arks.loader
+import arks.naans
+
+DOC = {
+    "metadata": {"date_modified": "2024-05-01T00:00:00", "count": 3},
+    "data": [
+        {"what": "12345", "rtype": "PublicNAAN", "who": {"name": "Ünïcode \"quoted\" name"}},
+        {"what": "12345/x5", "rtype": "PublicNAANShoulder", "naan": "12345", "shoulder": "x5"},
+        {"what": "99999", "rtype": "PublicNAAN", "score": -12345.678e-3, "flags": [True, False, None]},
+    ],
+    "trailer": {"generated": 1714521600},
+}
+
+
+def chunked(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def read(chunks):
+    doc = arks.naans.read_naan_records(chunks)
+    data = list(doc.pop("data"))
+    return doc, data
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 100000])
+def test_read_naan_records_chunk_boundaries(size):
+    text = json.dumps(DOC, indent=1, ensure_ascii=False)
+    doc, data = read(chunked(text, size))
+    assert data == DOC["data"]
+    # Members following "data" are read once the records are consumed
+    assert doc == {"metadata": DOC["metadata"], "trailer": DOC["trailer"]}
+
+
+def test_read_naan_records_number_at_chunk_end():
+    # A number split across chunks must not be decoded from its first part
+    doc, data = read(['{"metadata": {"n": 12', '34}, "data": [1', '0, 2', '0]}'])
+    assert doc["metadata"] == {"n": 1234}
+    assert data == [10, 20]
+
+
+def test_read_naan_records_data_before_metadata():
+    text = json.dumps({"data": DOC["data"], "metadata": DOC["metadata"]})
+    doc, data = read(chunked(text, 5))
+    assert data == DOC["data"]
+    assert doc == {"metadata": DOC["metadata"]}
+
+
+def test_read_naan_records_empty_data():
+    doc, data = read(['{"metadata": {}, "data": [ ] }'])
+    assert data == []
+    assert doc == {"metadata": {}}
+
+
+def test_read_naan_records_invalid():
+    with pytest.raises(ValueError):
+        read(['{"metadata": {}, "data": [1 2]}'])
+
+
+SOURCE = "https://naans.example.org/naan_records.json"
+LAST_MODIFIED = "Wed, 01 May 2024 00:00:00 GMT"
+
+
+def source_handler(requests):
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("if-none-match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(
+            200,
+            headers={"ETag": '"v1"', "Last-Modified": LAST_MODIFIED},
+            text=json.dumps(DOC),
+        )
+
+    return handler
+
+
+def load_into(db_str):
+    def load(records, state):
+        return arks.loader.records_to_db(records, db_str, source_state=state)
+
+    return load
+
+
+def test_load_source_saves_validators_and_sends_them(tmp_path):
+    db_str = f"sqlite:///{tmp_path}/registry.sqlite"
+    engine = arks.db.get_writer_engine(db_str)
+    requests = []
+    with httpx.Client(transport=httpx.MockTransport(source_handler(requests))) as client:
+        assert arks.naans.load_source(client, SOURCE, engine, load_into(db_str))[0] == 3
+        state = arks.naans.read_source_state(engine, SOURCE)
+        assert state == {"etag": '"v1"', "last_modified": LAST_MODIFIED}
+        # Not modified: load is not called
+        assert arks.naans.load_source(client, SOURCE, engine, lambda *args: pytest.fail()) is None
+        assert requests[1].headers["if-none-match"] == '"v1"'
+        assert requests[1].headers["if-modified-since"] == LAST_MODIFIED
+        # force ignores the saved validators
+        assert arks.naans.load_source(client, SOURCE, engine, load_into(db_str), force=True) is not None
+        assert "if-none-match" not in requests[2].headers
+    engine.dispose()
+
+
+def test_load_source_new_registry_is_loaded(tmp_path):
+    requests = []
+    with httpx.Client(transport=httpx.MockTransport(source_handler(requests))) as client:
+        for name in ("registry.sqlite", "rebuilt.sqlite"):
+            db_str = f"sqlite:///{tmp_path}/{name}"
+            engine = arks.db.get_writer_engine(db_str)
+            assert arks.naans.load_source(client, SOURCE, engine, load_into(db_str))[1] == 3
+            engine.dispose()
+    # The validators of the first registry are not sent for the second
+    assert "if-none-match" not in requests[1].headers
+
+
+def test_load_source_state_is_per_source(tmp_path):
+    engine = arks.db.get_writer_engine(f"sqlite:///{tmp_path}/registry.sqlite")
+    assert arks.naans.read_source_state(engine, SOURCE) == {}
+    arks.naans.create_digest_table(engine)
+    with sqlalchemy.orm.Session(engine) as session:
+        state = {"source": SOURCE, "etag": '"v1"', "last_modified": None}
+        arks.naans.save_source_state(session, state, datetime.datetime.now())
+        session.commit()
+    assert arks.naans.read_source_state(engine, SOURCE) == {"etag": '"v1"'}
+    assert arks.naans.read_source_state(engine, "https://other.example.org/") == {}
+
+
+def test_load_source_error_keeps_state(tmp_path):
+    db_str = f"sqlite:///{tmp_path}/registry.sqlite"
+    engine = arks.db.get_writer_engine(db_str)
+    with httpx.Client(transport=httpx.MockTransport(source_handler([]))) as client:
+        arks.naans.load_source(client, SOURCE, engine, load_into(db_str))
+
+    def handler(request):
+        return httpx.Response(500, headers={"ETag": '"v2"'})
+
+    with httpx.Client(transport=httpx.MockTransport(handler)) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            arks.naans.load_source(client, SOURCE, engine, load_into(db_str), force=True)
+    assert arks.naans.read_source_state(engine, SOURCE)["etag"] == '"v1"'
+    engine.dispose()
@@ -0,0 +1,54 @@
+import arks.cache
+import arks.index
+import arks.notfound
+import arks.resolve
+
+
+def make_not_found_app(make_app, known=None):
+    return make_app(
+        arks.notfound.NotFoundMiddleware,
+        negative_cache=arks.cache.TTLCache(100, 60.0),
+        registry_updated="1",
+        known_prefixes=known,
+        identifier_splitter=arks.resolve.IdentifierSplitter(),
+        unknown_naan_rejects=0,
+    )
+
+
+def test_not_found_responses_are_cached(make_app, run):
+    app = make_not_found_app(make_app)
+    first, second, head, other = run(app, [
+        ("GET", "/ark:/12345/missing"),
+        ("GET", "/ark:/12345/missing"),
+        ("HEAD", "/ark:/12345/missing"),
+        ("GET", "/ark:/12345/found"),
+    ])
+    assert app.state.calls == 2
+    assert second.status_code == head.status_code == 404
+    assert second.json() == first.json() == {"detail": "nope"}
+    assert second.headers["x-miss"] == "1"
+    assert head.content == b""
+    assert other.status_code == 200
+
+
+def test_registry_update_drops_cached_misses(make_app, run):
+    app = make_not_found_app(make_app)
+    run(app, [("GET", "/ark:/12345/missing")])
+    app.state.registry_updated = "2"
+    run(app, [("GET", "/ark:/12345/missing")])
+    assert app.state.calls == 2
+
+
+def test_unregistered_naans_are_rejected(make_app, run):
+    known = arks.index.PrefixSet([("ark", None), ("ark", "12345")])
+    app = make_not_found_app(make_app, known)
+    responses = run(app, [
+        ("GET", "/ark:/99999/x"),
+        ("GET", "/ark:/12345/x"),
+        ("GET", "/doi:10.1/x"),
+        ("GET", "/.info/ark:/99999"),
+    ])
+    assert [r.status_code for r in responses] == [404, 200, 200, 200]
+    assert responses[0].json() == {"detail": "Not Found"}
+    assert app.state.unknown_naan_rejects == 1
+    assert app.state.calls == 3
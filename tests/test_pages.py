@@ -0,0 +1,34 @@
+import os.path
+
+import fastapi
+import fastapi.templating
+
+import arks.pages
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(arks.pages.__file__), "templates")
+
+
+def rendered_pages():
+    templates = fastapi.templating.Jinja2Templates(directory=TEMPLATE_DIR)
+    templates.env.globals.setdefault("relurl_for", lambda name, **kwargs: f"/{name}")
+    return arks.pages.render_pages(templates.env, {"environment": "test", "version": "0"})
+
+
+def request(path, headers=()):
+    return fastapi.Request({"type": "http", "method": "GET", "path": path, "headers": list(headers)})
+
+
+def test_not_found_page_shows_escaped_path():
+    page = rendered_pages()[arks.pages.NOT_FOUND_PAGE]
+    assert page.per_request
+    response = arks.pages.page_response(page, request("/_<b>x&y"), status_code=404)
+    assert response.status_code == 404
+    assert b"<code>/_&lt;b&gt;x&amp;y</code>" in response.body
+    assert "etag" not in response.headers
+
+
+def test_static_page_is_conditional():
+    page = rendered_pages()["index.html"]
+    assert not page.per_request
+    response = arks.pages.page_response(page, request("/", [(b"if-none-match", page.etag.encode())]))
+    assert response.status_code == 304
@@ -0,0 +1,80 @@
+import pytest
+
+import arks.ratelimit
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def limiter(rate=2.0, burst=3, maxsize=10):
+    clock = Clock()
+    return arks.ratelimit.TokenBucketLimiter(rate, burst, maxsize, clock=clock), clock
+
+
+def test_burst_then_wait():
+    rl, _ = limiter()
+    assert [rl.acquire("a") for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert rl.acquire("a") == pytest.approx(0.5)
+    # Other clients have their own bucket
+    assert rl.acquire("b") == 0.0
+
+
+def test_refill():
+    rl, clock = limiter()
+    for _ in range(3):
+        rl.acquire("a")
+    clock.now += 0.25
+    # Half a token refilled, half a token still missing at 2 per second
+    assert rl.acquire("a") == pytest.approx(0.25)
+    clock.now += 0.25
+    assert rl.acquire("a") == 0.0
+    # Refill is capped at burst
+    clock.now += 60
+    assert [rl.acquire("a") for _ in range(4)][-2:] == [0.0, pytest.approx(0.5)]
+
+
+def test_lru_eviction():
+    rl, _ = limiter(maxsize=2)
+    for _ in range(3):
+        rl.acquire("a")
+    rl.acquire("b")
+    # a was used more recently than b
+    rl.acquire("a")
+    rl.acquire("c")
+    assert len(rl) == 2
+    assert rl.acquire("a") > 0
+    for _ in range(3):
+        rl.acquire("c")
+    # b was dropped, so starts again with a full bucket
+    assert rl.acquire("b") == 0.0
+
+
+@pytest.mark.parametrize(
+    "forwarded_for,proxy_count,expected",
+    [
+        # The peer is used without proxies, X-Forwarded-For is set by the client
+        ("1.1.1.1", 0, "10.0.0.1"),
+        (None, 1, "10.0.0.1"),
+        ("", 1, "10.0.0.1"),
+        ("1.1.1.1", 1, "1.1.1.1"),
+        ("6.6.6.6, 1.1.1.1", 1, "1.1.1.1"),
+        ("6.6.6.6, 1.1.1.1, 2.2.2.2", 2, "1.1.1.1"),
+        (" 6.6.6.6 ,1.1.1.1 ", 1, "1.1.1.1"),
+        # Fewer entries than proxies
+        ("1.1.1.1", 2, "10.0.0.1"),
+        # Empty entries
+        ("6.6.6.6, ", 1, "10.0.0.1"),
+        (",", 2, "10.0.0.1"),
+    ],
+)
+def test_client_address(forwarded_for, proxy_count, expected):
+    assert arks.ratelimit.client_address("10.0.0.1", forwarded_for, proxy_count) == expected
+
+
+def test_client_address_without_peer():
+    assert arks.ratelimit.client_address(None, None, 0) == ""
@@ -0,0 +1,83 @@
+import asyncio
+import datetime
+
+import httpx
+
+import arks.replay
+
+
+def log_line(request_line, status=302, time="01/May/2024:12:00:00 +0000"):
+    return f'10.0.0.1 "-" [{time}] "{request_line}" {status} 0 "-" "agent"\n'
+
+
+def test_parse_log():
+    lines = [
+        log_line("GET /ark:/12345/x HTTP/1.1"),
+        log_line("GET /ark:/12345/a b HTTP/1.1", status=404, time="01/May/2024:12:00:01 +0000"),
+        log_line("HEAD /ark:/12345/y"),
+        "not a log line\n",
+        log_line("GET"),
+        log_line("GET /ark:/12345/z HTTP/1.1", time="yesterday"),
+    ]
+    records = list(arks.replay.parse_log(lines))
+    assert [(r.method, r.uri, r.status) for r in records] == [
+        ("GET", "/ark:/12345/x", 302),
+        ("GET", "/ark:/12345/a b", 404),
+        ("HEAD", "/ark:/12345/y", 302),
+    ]
+    assert records[1].time - records[0].time == datetime.timedelta(seconds=1)
+
+
+def test_resolver_records():
+    t = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+    records = [
+        arks.replay.LogRecord(t, method, uri, 200)
+        for method, uri in [
+            ("GET", "/ark:/12345/x"),
+            ("GET", "/.info/ark:/12345"),
+            ("GET", "/api/v1/metrics"),
+            ("GET", "/static/site.css"),
+            ("GET", "/_about?x=ark:1"),
+            ("POST", "/ark:/12345/x"),
+            ("HEAD", "//ark:/12345/x"),
+        ]
+    ]
+    uris = [(r.method, r.uri) for r in arks.replay.resolver_records(records)]
+    assert uris == [
+        ("GET", "/ark:/12345/x"),
+        ("GET", "/.info/ark:/12345"),
+        ("GET", "/api/v1/metrics"),
+        ("HEAD", "//ark:/12345/x"),
+    ]
+
+
+def run_replay(records, statuses):
+    paths = []
+
+    def handler(request):
+        paths.append(request.url.raw_path.decode("ascii"))
+        return httpx.Response(statuses.get(request.url.path, 302))
+
+    async def _run():
+        transport = httpx.MockTransport(handler)
+        async with httpx.AsyncClient(transport=transport, base_url="http://t") as client:
+            return await arks.replay.replay(client, records, speed=0)
+
+    return asyncio.run(_run()), paths
+
+
+def test_replay():
+    t = datetime.datetime(2024, 5, 1, tzinfo=datetime.timezone.utc)
+    records = [
+        arks.replay.LogRecord(t, "GET", "//ark:/12345/x", 302),
+        arks.replay.LogRecord(t, "GET", "/ark:/12345/ü?info", 200),
+        arks.replay.LogRecord(t, "GET", "/.info/ark:/12345", 404),
+        # Longer than httpx accepts
+        arks.replay.LogRecord(t, "GET", "/ark:/12345/" + "x" * 70000, 302),
+    ]
+    summary, paths = run_replay(records, {"/.info/ark:/12345": 200, "/ark:/12345/ü": 200})
+    assert sorted(paths) == ["/.info/ark:/12345", "//ark:/12345/x", "/ark:/12345/%C3%BC?info"]
+    assert summary["status"] == {"200": 2, "302": 1, "error": 1}
+    assert summary["mismatches"] == {"404->200": 1}
+    assert summary["status_match"] == round(2 / 3, 4)
+    assert summary["overall"]["count"] == 3
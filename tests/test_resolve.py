@@ -0,0 +1,79 @@
+import re
+import types
+
+import pytest
+
+import arks.cache
+import arks.index
+import arks.resolve
+
+
+@pytest.mark.parametrize(
+    "pattern,expected",
+    [
+        ("(^https?://?n2t.net/)|(^https?://?arks.org/)", ("http", "http")),
+        ("^n2t/", ("n2t/",)),
+        ("n2t/", None),
+        ("((^n2t/)|(^arks/))", None),
+        ("(^(n2t|arks)/)", None),
+        ("(^n2t[|]/)", ("n2t",)),
+    ],
+)
+def test_literal_prefixes(pattern, expected):
+    assert arks.resolve.literal_prefixes(pattern) == expected
+
+
+@pytest.mark.parametrize(
+    "pattern",
+    [
+        "(^https?://?n2t.net/)|(^https?://?arks.org/)",
+        "((^n2t/)|(^arks/))",
+        "(^(n2t|arks)/)",
+        "^n2t/",
+    ],
+)
+@pytest.mark.parametrize(
+    "identifier",
+    ["https://n2t.net/ark:/1/x", "http://arks.org/ark:/1/x", "n2t/ark:/1/x", "arks/ark:/1/x", "ark:/1/x"],
+)
+def test_strip_matches_pattern(pattern, identifier):
+    splitter = arks.resolve.IdentifierSplitter(pattern)
+    assert splitter.strip(identifier) == re.compile(pattern).sub("", identifier)
+
+
+def make_redirect_app(make_app, index):
+    return make_app(
+        arks.resolve.RedirectMiddleware,
+        settings=types.SimpleNamespace(auto_introspection=True, redirect_max_age=300),
+        resolver_index=index,
+        async_dbengine=None,
+        resolve_cache=arks.cache.TTLCache(100, 60.0),
+        registry_updated="1",
+        identifier_splitter=arks.resolve.IdentifierSplitter(),
+    )
+
+
+def test_redirect_middleware(make_app, run):
+    index = arks.index.PrefixIndex([
+        arks.index.IndexEntry("ark:12345/", "ark", "12345", None, "https://a.example.org/${value}", 302),
+    ])
+    app = make_redirect_app(make_app, index)
+    responses = run(app, [
+        ("GET", "/ark:/12345/x"),
+        ("HEAD", "/ark:/12345/x"),
+        ("GET", "/ark:/12345"),
+        ("GET", "/ark:/12345/x?info"),
+        ("POST", "/ark:/12345/x"),
+        ("GET", "/static/x"),
+    ])
+    assert [r.status_code for r in responses] == [302, 302, 200, 200, 200, 200]
+    assert responses[0].headers["location"] == "https://a.example.org/x"
+    assert responses[0].headers["cache-control"] == "public, max-age=300"
+    assert "etag" in responses[1].headers
+    assert app.state.calls == 4
+
+
+def test_redirect_middleware_disabled(make_app, run):
+    app = make_redirect_app(make_app, None)
+    assert run(app, [("GET", "/ark:/12345/x")])[0].json() == {"rslv": "ark:/12345/x"}
+    assert app.state.calls == 1
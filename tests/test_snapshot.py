@@ -0,0 +1,81 @@
+import random
+
+import pytest
+import sqlalchemy
+import sqlalchemy.orm
+
+import rslv.lib_rslv.piddefine
+
+import arks.index
+import arks.snapshot
+
+DEFINITIONS = [
+    ("ark", None, None, "/.info/${pid}"),
+    ("ark", "12345", None, "https://a.example.org/${value}"),
+    ("ark", "12345", "x5", "https://x5.example.org/${value}"),
+    ("ark", "12345", "x5b", "https://x5b.example.org/${value}"),
+    ("ark", "12345", "b2", "https://b2.example.org/${value}"),
+    # Shoulders without a NAAN level definition
+    ("ark", "67890", "fk4", "https://fk4.example.org/${value}"),
+    ("ark", "99999", None, "https://test.example.org/${content}"),
+    ("ark", "99999", "fk4", None),
+    # A scheme without a scheme level definition
+    ("doi", "10.5061", None, "https://doi.example.org/${content}"),
+    ("doi", "10.5061", "dryad", "https://dryad.example.org/${value}"),
+]
+
+
+@pytest.fixture(scope="module")
+def registry(tmp_path_factory):
+    path = tmp_path_factory.mktemp("snapshot")
+    engine = sqlalchemy.create_engine(f"sqlite:///{path}/registry.sqlite")
+    rslv.lib_rslv.piddefine.create_database(engine, description="test")
+    with sqlalchemy.orm.Session(engine) as session:
+        for scheme, prefix, value, target in DEFINITIONS:
+            session.add(rslv.lib_rslv.piddefine.PidDefinition(
+                scheme=scheme, prefix=prefix, value=value, target=target, http_code=302,
+            ))
+        session.commit()
+    session = sqlalchemy.orm.Session(engine)
+    entries = list(arks.index.load_entries(session))
+    snapshot_path = str(path / "registry.snapshot")
+    arks.snapshot.write_snapshot(snapshot_path, entries, updated="2024-05-01T00:00:00")
+    snapshot = arks.snapshot.SnapshotIndex(snapshot_path)
+    yield session, arks.index.PrefixIndex(entries), snapshot
+    snapshot.close()
+    session.close()
+    engine.dispose()
+
+
+def queries(n, seed=20240501):
+    rnd = random.Random(seed)
+    schemes = ["ark", "ark", "ark", "doi", "urn", ""]
+    prefixes = ["12345", "12345", "67890", "99999", "10.5061", "1234", "123456", "", None]
+    stems = ["x5", "x5b", "x5bc", "b2", "fk4", "dryad", "x", "", "b"]
+    for _ in range(n):
+        value = rnd.choice(stems) + "".join(rnd.choice("abc5") for _ in range(rnd.randrange(3)))
+        yield rnd.choice(schemes), rnd.choice(prefixes), rnd.choice([value, value, None])
+
+
+def test_snapshot_round_trip(registry):
+    _, index, snapshot = registry
+    assert len(snapshot) == len(index) == len(DEFINITIONS)
+    assert sorted(snapshot) == sorted(index)
+    assert snapshot.updated == "2024-05-01T00:00:00"
+    assert snapshot.has_prefix("ark", "67890")
+    assert not snapshot.has_prefix("ark", "6789")
+
+
+def test_lookups_agree(registry):
+    session, index, snapshot = registry
+    for scheme, prefix, value in queries(2000):
+        expected = arks.index.lookup_entry(session, scheme, prefix, value)
+        assert index.lookup(scheme, prefix, value) == expected, (scheme, prefix, value)
+        assert snapshot.lookup(scheme, prefix, value) == expected, (scheme, prefix, value)
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not.snapshot"
+    path.write_bytes(b"not a snapshot" * 10)
+    with pytest.raises(ValueError):
+        arks.snapshot.SnapshotIndex(str(path))